@@ -0,0 +1,239 @@
+"""
+Analysis Cache - 视频分析结果缓存
+同一条爆款视频会以 vm / vt 短链、/t/ 短链和完整 /@user/video/<id> 链接反复出现。
+先把链接解析为规范视频 ID，再按 ID 分两层缓存分析结果：
+
+- 进程内 LRU（带 TTL）
+- 共享层：本地 SQLite，或 Directus sourcing_requests.video_url（多实例共享）
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from metrics import Counter
+
+ANALYSIS_CACHE_BACKEND = os.getenv("ANALYSIS_CACHE_BACKEND", "sqlite").lower()
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "512"))
+ANALYSIS_CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "analysis_cache.db"
+)
+
+# 完整链接中的视频 ID：/@user/video/<id>、m.tiktok.com/v/<id>.html
+_VIDEO_ID_PATTERN = re.compile(r"/(?:video|v)/(\d{8,})")
+_SHORT_LINK_HOSTS = ("vm.tiktok.com", "vt.tiktok.com")
+_MAX_REDIRECTS = 5
+
+ANALYSIS_CACHE_LOOKUPS = Counter(
+    "analysis_cache_lookups_total", "视频分析缓存查询次数", ("result",)
+)
+
+
+# ==================== 规范视频 ID ====================
+
+def parse_video_id(url: str) -> Optional[str]:
+    """从完整链接中提取视频 ID（短链返回 None）"""
+    match = _VIDEO_ID_PATTERN.search(urlparse(url).path)
+    return match.group(1) if match else None
+
+
+def is_short_link(url: str) -> bool:
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    return host in _SHORT_LINK_HOSTS or (host.endswith("tiktok.com") and parsed.path.startswith("/t/"))
+
+
+class VideoIdResolver:
+    """解析短链跳转得到视频 ID；短链 -> (ID, 完整链接) 的映射在进程内缓存"""
+
+    def __init__(self, max_entries: int = 4096, timeout: float = 5.0):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._short_links: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    async def resolve(self, url: str) -> Tuple[Optional[str], str]:
+        """
+        返回 (视频 ID, 完整链接)
+
+        无法解析时返回 (None, 原链接)，调用方应跳过缓存
+        """
+        video_id = parse_video_id(url)
+        if video_id is not None:
+            return video_id, url.split("?")[0]
+        if not is_short_link(url):
+            return None, url
+
+        cached = self._short_links.get(url)
+        if cached is not None:
+            self._short_links.move_to_end(url)
+            return cached
+
+        resolved = await self._follow_redirects(url)
+        if resolved is None:
+            return None, url
+
+        self._short_links[url] = resolved
+        while len(self._short_links) > self.max_entries:
+            self._short_links.popitem(last=False)
+        return resolved
+
+    async def _follow_redirects(self, url: str) -> Optional[Tuple[str, str]]:
+        """逐跳读取 Location，拿到视频 ID 即停止，不下载页面正文"""
+        current = url
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout, follow_redirects=False) as http:
+                for _ in range(_MAX_REDIRECTS):
+                    # 只读响应头
+                    async with http.stream("GET", current) as response:
+                        location = response.headers.get("location")
+                        if not response.is_redirect or not location:
+                            return None
+                    current = urljoin(current, location)
+                    video_id = parse_video_id(current)
+                    if video_id is not None:
+                        return video_id, current.split("?")[0]
+        except httpx.HTTPError as e:
+            print(f"⚠️ 短链解析失败 {url}: {e}")
+        return None
+
+
+# ==================== 共享层 ====================
+
+class SqliteAnalysisStore:
+    """本地 SQLite 共享层（同一主机上的多个进程共享）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_analysis (
+                video_id TEXT PRIMARY KEY,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    async def get(self, video_id: str, max_age: float) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT analysis FROM video_analysis WHERE video_id = ? AND created_at >= ?",
+            (video_id, time.time() - max_age)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def put(self, video_id: str, analysis: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO video_analysis (video_id, analysis, created_at) VALUES (?, ?, ?)",
+            (video_id, json.dumps(analysis, ensure_ascii=False, default=str), time.time())
+        )
+
+    def purge_expired(self, max_age: float) -> int:
+        cursor = self._conn.execute(
+            "DELETE FROM video_analysis WHERE created_at < ?", (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+
+class DirectusAnalysisStore:
+    """
+    以 Directus sourcing_requests 为共享层（多实例共享）
+
+    写入由询盘记录本身完成（visual_analysis + 完整 video_url），这里只负责查询
+    """
+
+    async def get(self, video_id: str, max_age: float) -> Optional[Dict[str, Any]]:
+        from directus_client import find_recent_video_analysis
+
+        return await find_recent_video_analysis(video_id, max_age)
+
+    async def put(self, video_id: str, analysis: Dict[str, Any]) -> None:
+        return None
+
+
+# ==================== 两级缓存 ====================
+
+class AnalysisCache:
+    """进程内 LRU + 可选共享层；两层使用同一 TTL"""
+
+    def __init__(self, ttl: float, max_entries: int, store=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    async def get(self, video_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """返回 (分析结果, 命中层级 memory / shared / miss)"""
+        entry = self._entries.get(video_id)
+        if entry is not None:
+            analysis, stored_at = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(video_id)
+                ANALYSIS_CACHE_LOOKUPS.inc("memory")
+                return analysis, "memory"
+            del self._entries[video_id]
+
+        if self.store is not None:
+            try:
+                analysis = await self.store.get(video_id, self.ttl)
+            except Exception as e:
+                print(f"⚠️ 分析缓存共享层读取失败: {e}")
+                analysis = None
+            if analysis:
+                self._remember(video_id, analysis)
+                ANALYSIS_CACHE_LOOKUPS.inc("shared")
+                return analysis, "shared"
+
+        ANALYSIS_CACHE_LOOKUPS.inc("miss")
+        return None, "miss"
+
+    async def put(self, video_id: str, analysis: Dict[str, Any]) -> None:
+        self._remember(video_id, analysis)
+        if self.store is not None:
+            try:
+                await self.store.put(video_id, analysis)
+            except Exception as e:
+                print(f"⚠️ 分析缓存共享层写入失败: {e}")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _remember(self, video_id: str, analysis: Dict[str, Any]) -> None:
+        self._entries[video_id] = (analysis, time.monotonic())
+        self._entries.move_to_end(video_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_cache: Optional[AnalysisCache] = None
+_resolver = VideoIdResolver()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """按 ANALYSIS_CACHE_BACKEND (sqlite / directus / memory) 创建进程级缓存（首次使用时创建）"""
+    global _cache
+
+    if _cache is None:
+        store = None
+        if ANALYSIS_CACHE_BACKEND == "sqlite":
+            store = SqliteAnalysisStore(ANALYSIS_CACHE_PATH)
+            store.purge_expired(ANALYSIS_CACHE_TTL)
+        elif ANALYSIS_CACHE_BACKEND == "directus":
+            store = DirectusAnalysisStore()
+        _cache = AnalysisCache(ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_MAX_ENTRIES, store)
+    return _cache
+
+
+async def resolve_video_id(url: str) -> Tuple[Optional[str], str]:
+    return await _resolver.resolve(url)
@@ -0,0 +1,228 @@
+"""
+Analysis Schema - 产品分析输出契约
+系统提示词中的 JSON 字段整理为 JSON Schema：用于 Structured Outputs 请求，
+并在导入时预编译为逐字段校验函数；校验失败的字段先做本地纠正，再交给定向修复。
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "product_name": {"type": "string", "minLength": 1},
+        "category": {"type": "string", "minLength": 1},
+        "features": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "materials": {"type": "array", "items": {"type": "string"}},
+        "estimated_dimensions": {"type": "string"},
+        "target_audience": {"type": "string"},
+        "selling_points": {"type": "array", "items": {"type": "string"}},
+        "estimated_price_range": {"type": "string"},
+        "sourcing_difficulty": {"type": "string", "enum": ["low", "medium", "high"]},
+        "sourcing_advice": {"type": "string"},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+    },
+    "required": [
+        "product_name", "category", "features", "materials", "estimated_dimensions",
+        "target_audience", "selling_points", "estimated_price_range",
+        "sourcing_difficulty", "sourcing_advice", "confidence"
+    ],
+    "additionalProperties": False,
+}
+
+# 多视频合并请求的输出：每个视频一项，video_index 对应请求中的【视频 i】标注
+BATCH_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"video_index": {"type": "integer"}, **ANALYSIS_SCHEMA["properties"]},
+                "required": ["video_index", *ANALYSIS_SCHEMA["required"]],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["items"],
+    "additionalProperties": False,
+}
+
+Check = Callable[[Any], Optional[str]]
+
+
+def _compile_property(prop: Dict[str, Any]) -> Check:
+    """把单个属性定义编译为校验函数（返回错误描述，合法时返回 None）"""
+    kind = prop.get("type")
+
+    if kind == "string":
+        enum = set(prop["enum"]) if "enum" in prop else None
+        min_length = prop.get("minLength", 0)
+
+        def check_string(value: Any) -> Optional[str]:
+            if not isinstance(value, str):
+                return "应为字符串"
+            if len(value.strip()) < min_length:
+                return "不能为空"
+            if enum is not None and value not in enum:
+                return f"取值应为 {sorted(enum)} 之一"
+            return None
+        return check_string
+
+    if kind == "number":
+        minimum = prop.get("minimum")
+        maximum = prop.get("maximum")
+
+        def check_number(value: Any) -> Optional[str]:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return "应为数字"
+            if minimum is not None and value < minimum:
+                return f"应 >= {minimum}"
+            if maximum is not None and value > maximum:
+                return f"应 <= {maximum}"
+            return None
+        return check_number
+
+    if kind == "array":
+        check_item = _compile_property(prop.get("items", {}))
+        min_items = prop.get("minItems", 0)
+
+        def check_array(value: Any) -> Optional[str]:
+            if not isinstance(value, list):
+                return "应为数组"
+            if len(value) < min_items:
+                return f"至少 {min_items} 项"
+            for item in value:
+                error = check_item(item)
+                if error:
+                    return f"元素{error}"
+            return None
+        return check_array
+
+    return lambda value: None
+
+
+def compile_validator(schema: Dict[str, Any]) -> Callable[[Any], Dict[str, str]]:
+    """
+    预编译 object schema 的校验函数
+
+    返回 {字段名: 错误描述}；空字典表示通过。逐字段给出错误，便于只修复出错字段
+    """
+    required = set(schema.get("required", ()))
+    checks = [(name, _compile_property(prop), name in required) for name, prop in schema["properties"].items()]
+
+    def validate(obj: Any) -> Dict[str, str]:
+        if not isinstance(obj, dict):
+            return {"$": "应为 JSON 对象"}
+        errors: Dict[str, str] = {}
+        for name, check, is_required in checks:
+            if name not in obj:
+                if is_required:
+                    errors[name] = "缺失"
+                continue
+            error = check(obj[name])
+            if error:
+                errors[name] = error
+        return errors
+
+    return validate
+
+
+validate_analysis = compile_validator(ANALYSIS_SCHEMA)
+
+# Structured Outputs 严格模式不接受的取值约束（由本地校验器负责）
+_UNSUPPORTED_STRICT_KEYWORDS = {"minLength", "minimum", "maximum", "minItems"}
+
+
+def _strict_schema(schema: Any) -> Any:
+    if isinstance(schema, dict):
+        return {
+            key: _strict_schema(value)
+            for key, value in schema.items()
+            if key not in _UNSUPPORTED_STRICT_KEYWORDS
+        }
+    return schema
+
+
+def response_format(schema: Dict[str, Any] = ANALYSIS_SCHEMA, name: str = "product_analysis") -> Dict[str, Any]:
+    """chat.completions 的 response_format（json_schema 严格模式）"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": _strict_schema(schema)},
+    }
+
+
+def subschema(fields: List[str]) -> Dict[str, Any]:
+    """只包含指定字段的子 schema（定向修复时使用）"""
+    return {
+        "type": "object",
+        "properties": {name: ANALYSIS_SCHEMA["properties"][name] for name in fields},
+        "required": list(fields),
+        "additionalProperties": False,
+    }
+
+
+# ==================== 本地纠正 ====================
+
+_DIFFICULTY_ALIASES = {
+    "low": "low", "easy": "low", "低": "low", "容易": "low",
+    "medium": "medium", "moderate": "medium", "mid": "medium", "中": "medium", "中等": "medium",
+    "high": "high", "hard": "high", "difficult": "high", "高": "high", "困难": "high",
+}
+_LIST_SPLIT = re.compile(r"[\n,，;；、]+")
+
+
+def _coerce(name: str, value: Any) -> Any:
+    prop = ANALYSIS_SCHEMA["properties"][name]
+    kind = prop.get("type")
+
+    if kind == "number" and isinstance(value, str):
+        match = re.search(r"\d+(?:\.\d+)?", value)
+        if match:
+            number = float(match.group())
+            value = number / 100 if "%" in value or number > 1 else number
+    if kind == "number" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        # 0-1 取值的字段（置信度）给出 60 这类百分数时与字符串 "60" 一样按百分比换算，而不是截断为 1
+        if prop.get("maximum") == 1 and value > 1:
+            value = value / 100
+        value = min(max(float(value), prop.get("minimum", value)), prop.get("maximum", value))
+
+    if kind == "array" and isinstance(value, str):
+        value = [part.strip(" -•*") for part in _LIST_SPLIT.split(value) if part.strip(" -•*")]
+    if kind == "array" and isinstance(value, list):
+        value = [item if isinstance(item, str) else str(item) for item in value]
+
+    if kind == "string" and "enum" in prop and isinstance(value, str):
+        value = _DIFFICULTY_ALIASES.get(value.strip().lower(), value)
+    if kind == "string" and isinstance(value, (int, float, list)) and "enum" not in prop:
+        value = "、".join(map(str, value)) if isinstance(value, list) else str(value)
+
+    return value
+
+
+def coerce_fields(analysis: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, Any]:
+    """对校验失败的字段做无需模型调用的类型纠正（百分比置信度、字符串列表、难度别名等）"""
+    fixed = dict(analysis)
+    for name in errors:
+        if name in fixed and name in ANALYSIS_SCHEMA["properties"]:
+            fixed[name] = _coerce(name, fixed[name])
+    return fixed
+
+
+def fill_defaults(analysis: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, Any]:
+    """修复后仍不合法的字段填入占位值，保证下游按契约读取不出错"""
+    defaults = {"string": "", "array": [], "number": 0.3}
+    fixed = dict(analysis)
+    for name in errors:
+        prop = ANALYSIS_SCHEMA["properties"].get(name)
+        if prop is None:
+            continue
+        if "enum" in prop:
+            fixed[name] = "medium"
+        elif name == "product_name":
+            fixed[name] = "未能识别"
+        else:
+            fixed[name] = defaults[prop["type"]]
+    # 有字段无法修复时下调置信度
+    fixed["confidence"] = min(fixed.get("confidence", 0.3), 0.3)
+    return fixed
@@ -7,19 +7,21 @@ import discord
 import os
 import asyncio
 import re
+import signal
 from datetime import datetime
-from dotenv import load_dotenv
+from typing import Optional
 
+import config  # noqa: F401  须先于读取环境变量的模块导入
 from directus_client import (
+    init_directus,
+    close_directus,
     create_sourcing_request, 
     search_factory_match,
     get_user_sourcing_history,
     create_discord_message
 )
-from tiktok_hunter import analyze_tiktok_video, calculate_price
-
-# 加载环境变量
-load_dotenv()
+from tiktok_hunter import analyze_tiktok_video, calculate_price, preload_analysis, shutdown_analysis_workers
+from metrics import Counter, start_metrics_server, stop_metrics_server
 
 # 配置
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
@@ -34,6 +36,129 @@ intents.members = True
 client = discord.Client(intents=intents)
 
 
+# 状态消息编辑的最小间隔（秒），避免流式更新触发 Discord 限流
+EMBED_EDIT_INTERVAL = float(os.getenv("EMBED_EDIT_INTERVAL", "1.0"))
+
+# 流式分析时提前展示的字段：字段名 -> (embed 标题, 格式化函数)
+PREVIEW_FIELDS = {
+    "product_name": ("📦 识别产品", lambda v: f"**{v}**"),
+    "category": ("🏷️ 产品类目", str),
+    "features": ("✨ 产品特征", lambda v: "\n".join(f"• {f}" for f in v[:5]) if isinstance(v, list) else str(v)),
+}
+
+
+# ==================== Embed 增量更新 ====================
+
+class ThrottledEmbedEditor:
+    """
+    合并高频的 embed 修改：touch() 标记有更新，后台按最小间隔编辑消息，
+    flush() 保证最后一次修改送达
+    """
+    
+    def __init__(self, message: discord.Message, embed: discord.Embed, interval: float = EMBED_EDIT_INTERVAL):
+        self.message = message
+        self.embed = embed
+        self.interval = interval
+        self._dirty = False
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+    
+    def touch(self) -> None:
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def flush(self) -> None:
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._dirty:
+            await self._edit()
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            delay = self._last_edit + self.interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._edit()
+    
+    async def _edit(self) -> None:
+        self._dirty = False
+        self._last_edit = asyncio.get_running_loop().time()
+        await self.message.edit(embed=self.embed)
+
+
+def set_embed_field(embed: discord.Embed, name: str, value: str, inline: bool = False) -> None:
+    """按标题更新 embed 字段，不存在时追加"""
+    value = value[:1024] or "-"
+    for index, field in enumerate(embed.fields):
+        if field.name == name:
+            embed.set_field_at(index, name=name, value=value, inline=inline)
+            return
+    embed.add_field(name=name, value=value, inline=inline)
+
+
+# ==================== 推测执行 ====================
+
+SPECULATIVE_MATCHES = Counter(
+    "speculative_match_total", "推测工厂匹配的结果（hit / miss / none）", ("outcome",)
+)
+
+
+async def match_and_quote(product_name: str, category: str):
+    """工厂匹配 + 报价，返回 (factories, price_info)"""
+    factories = await search_factory_match(keywords=product_name, category=category)
+    price_info = calculate_price(category=category or "default", complexity="medium", quantity=1000)
+    return factories, price_info
+
+
+class SpeculativeMatch:
+    """
+    推测执行工厂匹配与报价
+    
+    流式分析一拿到 product_name + category 就在后台启动 match_and_quote；
+    级联升级后这两个字段变化时取消旧任务、按新值重启。
+    最终分析结果的 (产品名, 类目) 与推测一致时直接采用，否则重新计算
+    """
+    
+    def __init__(self):
+        self.fields = {}
+        self.key = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def observe(self, key: str, value) -> None:
+        if key not in ("product_name", "category") or not isinstance(value, str):
+            return
+        self.fields[key] = value
+        if len(self.fields) < 2:
+            return
+        
+        speculative_key = (self.fields["product_name"], self.fields["category"])
+        if speculative_key == self.key:
+            return
+        self.cancel()
+        self.key = speculative_key
+        self._task = asyncio.create_task(match_and_quote(*speculative_key))
+    
+    async def result(self, product_name: str, category: str):
+        """返回最终 (product_name, category) 对应的 (factories, price_info)"""
+        if self._task is not None and self.key == (product_name, category):
+            try:
+                result = await self._task
+                SPECULATIVE_MATCHES.inc("hit")
+                return result
+            except Exception as e:
+                print(f"⚠️ 推测匹配失败，重新计算: {str(e)}")
+        
+        SPECULATIVE_MATCHES.inc("none" if self._task is None else "miss")
+        self.cancel()
+        return await match_and_quote(product_name, category)
+    
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
 # ==================== 核心工作流 ====================
 
 async def process_tiktok_sourcing(message: discord.Message, url: str):
@@ -42,7 +167,7 @@ async def process_tiktok_sourcing(message: discord.Message, url: str):
     
     流程：
     1. 下载视频关键帧
-    2. GPT-4o 视觉分析
+    2. GPT-4o 视觉分析（流式输出出现产品名与类目后，即推测启动 3、4）
     3. 匹配园区工厂
     4. 生成报价单
     5. 存入 Directus
@@ -59,50 +184,59 @@ async def process_tiktok_sourcing(message: discord.Message, url: str):
     status_embed.add_field(name="🏭 工厂匹配", value="⏳ 等待中...", inline=True)
     
     status_msg = await message.reply(embed=status_embed)
+    editor = ThrottledEmbedEditor(status_msg, status_embed)
+    speculation = SpeculativeMatch()
+    
+    def on_field(key: str, value) -> None:
+        speculation.observe(key, value)
+        # 第一个字段到达时视频已下载并送入模型
+        if status_embed.fields[0].value != "✅ 完成":
+            status_embed.set_field_at(0, name="📹 视频下载", value="✅ 完成", inline=True)
+            status_embed.set_field_at(1, name="🤖 AI 分析", value="⏳ 进行中...", inline=True)
+        if key in PREVIEW_FIELDS and value:
+            title, render = PREVIEW_FIELDS[key]
+            set_embed_field(status_embed, title, render(value))
+        editor.touch()
     
     try:
-        # ===== Step 1: 视频分析 =====
-        await asyncio.sleep(1)  # 模拟下载
-        
-        status_embed.set_field_at(0, name="📹 视频下载", value="✅ 完成", inline=True)
-        status_embed.set_field_at(1, name="🤖 AI 分析", value="⏳ 进行中...", inline=True)
-        await status_msg.edit(embed=status_embed)
-        
-        # 调用 TikTok Hunter
-        analysis = await analyze_tiktok_video(url)
+        # ===== Step 1: 视频下载 + AI 分析（流式，字段到齐即展示） =====
+        analysis = await analyze_tiktok_video(url, on_field=on_field)
         
         if not analysis.get("success", False):
+            speculation.cancel()
+            await editor.flush()
             await send_error_message(message, "视频分析失败", analysis.get("error", "未知错误"))
             return
         
+        # 缓存命中 / 非流式结果在这里一次性补齐
+        for key, (title, render) in PREVIEW_FIELDS.items():
+            if analysis.get(key):
+                set_embed_field(status_embed, title, render(analysis[key]))
+        status_embed.set_field_at(0, name="📹 视频下载", value="✅ 完成", inline=True)
         status_embed.set_field_at(1, name="🤖 AI 分析", value="✅ 完成", inline=True)
         status_embed.set_field_at(2, name="🏭 工厂匹配", value="⏳ 进行中...", inline=True)
-        await status_msg.edit(embed=status_embed)
+        editor.touch()
+        await editor.flush()
         
-        # ===== Step 2: 工厂匹配 =====
-        factories = await search_factory_match(
-            keywords=analysis.get("product_name", ""),
-            category=analysis.get("category", "")
+        # ===== Step 2 + 3: 工厂匹配与报价（推测结果与最终类目一致时直接采用） =====
+        factories, price_info = await speculation.result(
+            analysis.get("product_name", ""),
+            analysis.get("category", "")
         )
         
         status_embed.set_field_at(2, name="🏭 工厂匹配", value=f"✅ 找到 {len(factories)} 家", inline=True)
         status_embed.title = "✅ 分析完成！"
         status_embed.color = 0x23A559  # Discord Green
-        await status_msg.edit(embed=status_embed)
-        
-        # ===== Step 3: 计算报价 =====
-        price_info = calculate_price(
-            category=analysis.get("category", "default"),
-            complexity="medium",
-            quantity=1000
-        )
+        editor.touch()
+        await editor.flush()
         
         # ===== Step 4: 存入 Directus =====
         record = await create_sourcing_request({
             "platform": "TikTok",
             "user_id": str(message.author.id),
             "user_name": message.author.name,
-            "video_url": url,
+            # 规范链接（含 /video/<id>），供分析缓存的 Directus 共享层按视频 ID 查询
+            "video_url": analysis.get("canonical_url", url),
             "product_name": analysis.get("product_name", "Unknown"),
             "visual_analysis": analysis,
             "status": "quoted",
@@ -126,6 +260,7 @@ async def process_tiktok_sourcing(message: discord.Message, url: str):
         )
         
     except Exception as e:
+        speculation.cancel()
         print(f"❌ 处理失败: {str(e)}")
         await send_error_message(message, "处理过程中出错", str(e))
 
@@ -308,7 +443,11 @@ async def handle_help_command(message: discord.Message):
 
 async def handle_history_command(message: discord.Message):
     """处理历史命令"""
-    history = await get_user_sourcing_history(str(message.author.id), limit=5)
+    history = await get_user_sourcing_history(
+        str(message.author.id),
+        limit=5,
+        fields=["product_name", "quote_price_usd", "status"]
+    )
     
     if not history:
         await message.reply("📭 您还没有询盘记录。发送 TikTok 链接开始第一次询价吧！")
@@ -334,6 +473,16 @@ async def handle_history_command(message: discord.Message):
 @client.event
 async def on_ready():
     """Bot 启动完成"""
+    # 打开进程级 Directus 连接池（断线重连时 on_ready 会再次触发，init 为幂等）
+    await init_directus()
+    try:
+        await start_metrics_server()
+    except OSError as e:
+        # 端口被占用等：指标端点不可用不影响 Bot 本身
+        print(f"⚠️ Metrics 端点启动失败: {str(e)}")
+    # 网关就绪后再在后台线程加载 OpenCV / OpenAI SDK，不拖慢连接
+    preload_analysis()
+    
     print(f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║                                                              ║
@@ -436,6 +585,26 @@ async def on_guild_join(guild: discord.Guild):
 
 # ==================== 启动 ====================
 
+async def main():
+    """运行 Bot，并在退出时释放 Directus 连接池与关键帧进程池"""
+    # systemctl stop / docker stop 发送 SIGTERM：关闭 Discord 客户端让 finally 刷新写后缓冲
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(client.close())
+        )
+    except (NotImplementedError, RuntimeError):
+        # Windows 事件循环不支持 add_signal_handler
+        pass
+    
+    try:
+        async with client:
+            await client.start(DISCORD_TOKEN)
+    finally:
+        await stop_metrics_server()
+        await close_directus()
+        shutdown_analysis_workers()
+
+
 if __name__ == "__main__":
     if not DISCORD_TOKEN:
         print("❌ 错误: 未设置 DISCORD_TOKEN 环境变量")
@@ -443,4 +612,7 @@ if __name__ == "__main__":
         exit(1)
     
     print("🔄 正在启动 Demand-OS Agent...")
-    client.run(DISCORD_TOKEN)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("👋 Demand-OS Agent 已停止")
@@ -0,0 +1,79 @@
+"""
+Codec - JSON 编解码与请求体压缩
+优先使用 orjson / msgspec（可选依赖），缺失时回退到标准库 json
+"""
+
+import json
+import gzip
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+
+class JsonCodec(NamedTuple):
+    """JSON 编解码器：dumps 返回 bytes，loads 接受 bytes"""
+    name: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+def _stdlib_codec() -> JsonCodec:
+    return JsonCodec(
+        "json",
+        lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        json.loads
+    )
+
+
+def _orjson_codec() -> Optional[JsonCodec]:
+    try:
+        import orjson
+    except ImportError:
+        return None
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    return JsonCodec("orjson", lambda obj: orjson.dumps(obj, option=option), orjson.loads)
+
+
+def _msgspec_codec() -> Optional[JsonCodec]:
+    try:
+        import msgspec
+    except ImportError:
+        return None
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return JsonCodec("msgspec", encoder.encode, decoder.decode)
+
+
+_CODEC_FACTORIES: Dict[str, Callable[[], Optional[JsonCodec]]] = {
+    "orjson": _orjson_codec,
+    "msgspec": _msgspec_codec,
+    "json": _stdlib_codec,
+}
+
+
+def get_json_codec(name: str = "auto") -> JsonCodec:
+    """
+    按名称获取编解码器
+
+    "auto" 依次尝试 orjson、msgspec、json；指定的库未安装时回退到 json
+    """
+    names = ["orjson", "msgspec", "json"] if name == "auto" else [name, "json"]
+    for candidate in names:
+        factory = _CODEC_FACTORIES.get(candidate)
+        codec = factory() if factory else None
+        if codec is not None:
+            return codec
+    return _stdlib_codec()
+
+
+def brotli_available() -> bool:
+    """httpx 只有在安装 brotli / brotlicffi 时才能解码 br 响应"""
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
+def gzip_body(body: bytes, level: int = 5) -> bytes:
+    return gzip.compress(body, compresslevel=level)
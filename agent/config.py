@@ -0,0 +1,9 @@
+"""
+Config - 环境变量加载
+入口模块在导入其他本地模块之前 import config：.env 在进程内只加载一次，
+且早于各模块在导入时读取 os.getenv 的常量（METRICS_PORT、FRAME_* 等）
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
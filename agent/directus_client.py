@@ -4,58 +4,929 @@ Directus Client for Demand-OS Agent
 """
 
 import os
+import re
+import json
+import time
+import uuid
+import asyncio
 import httpx
-from typing import Optional, List, Dict, Any
-from dotenv import load_dotenv
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, AsyncIterator, Awaitable, Callable, Hashable, Tuple
+from urllib.parse import quote, urlencode
 
-load_dotenv()
+import config  # noqa: F401  须先于读取环境变量的模块导入
+from metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
+from codec import brotli_available, get_json_codec, gzip_body
+from outbox import Outbox
+from resilience import CircuitBreaker, LatencyTracker, backoff_delay
+from supplier_index import SupplierIndex
 
 DIRECTUS_URL = os.getenv("DIRECTUS_URL", "http://localhost:8055")
 DIRECTUS_TOKEN = os.getenv("DIRECTUS_TOKEN", "")
 
+# 连接池配置
+DIRECTUS_TIMEOUT = float(os.getenv("DIRECTUS_TIMEOUT", "10"))
+DIRECTUS_HTTP2 = os.getenv("DIRECTUS_HTTP2", "true").lower() == "true"
+DIRECTUS_MAX_CONNECTIONS = int(os.getenv("DIRECTUS_MAX_CONNECTIONS", "20"))
+DIRECTUS_MAX_KEEPALIVE = int(os.getenv("DIRECTUS_MAX_KEEPALIVE", "10"))
+DIRECTUS_KEEPALIVE_EXPIRY = float(os.getenv("DIRECTUS_KEEPALIVE_EXPIRY", "60"))
+
+# 编解码与压缩配置
+DIRECTUS_JSON_CODEC = os.getenv("DIRECTUS_JSON_CODEC", "auto")
+DIRECTUS_REQUEST_GZIP = os.getenv("DIRECTUS_REQUEST_GZIP", "true").lower() == "true"
+DIRECTUS_GZIP_MIN_BYTES = int(os.getenv("DIRECTUS_GZIP_MIN_BYTES", "4096"))
+# 为 false 时写入前去掉 visual_analysis.raw_analysis（与解析后的字段重复）
+DIRECTUS_STORE_RAW_ANALYSIS = os.getenv("DIRECTUS_STORE_RAW_ANALYSIS", "true").lower() == "true"
+
+# 弹性策略配置（重试 / 对冲 / 熔断）
+DIRECTUS_MAX_RETRIES = int(os.getenv("DIRECTUS_MAX_RETRIES", "2"))
+DIRECTUS_HEDGE_MIN_DELAY = float(os.getenv("DIRECTUS_HEDGE_MIN_DELAY", "0.05"))
+DIRECTUS_BREAKER_THRESHOLD = int(os.getenv("DIRECTUS_BREAKER_THRESHOLD", "5"))
+DIRECTUS_BREAKER_RESET = float(os.getenv("DIRECTUS_BREAKER_RESET", "30"))
+
+# 写后缓冲配置（messages / agent_logs 批量写入）
+WRITE_BEHIND_COLLECTIONS = ("messages", "agent_logs")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("DIRECTUS_WRITE_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("DIRECTUS_WRITE_FLUSH_INTERVAL", "2.0"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("DIRECTUS_WRITE_MAX_PENDING", "1000"))
+
+# 批量更新配置
+BULK_CHUNK_SIZE = int(os.getenv("DIRECTUS_BULK_CHUNK_SIZE", "100"))
+BULK_CONCURRENCY = int(os.getenv("DIRECTUS_BULK_CONCURRENCY", "4"))
+
+# 供应商本地索引同步配置
+SUPPLIER_SYNC_ENABLED = os.getenv("SUPPLIER_SYNC_ENABLED", "true").lower() == "true"
+SUPPLIER_SYNC_INTERVAL = float(os.getenv("SUPPLIER_SYNC_INTERVAL", "60"))
+SUPPLIER_FULL_RESYNC_INTERVAL = float(os.getenv("SUPPLIER_FULL_RESYNC_INTERVAL", "3600"))
+
+# 本地写入 outbox 配置（sourcing_requests 持久化）
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "true").lower() == "true"
+OUTBOX_PATH = os.getenv("OUTBOX_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.db")
+OUTBOX_RETRY_INTERVAL = float(os.getenv("OUTBOX_RETRY_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "100"))
+
+# 进程级共享 HTTP 客户端（由 bot 生命周期管理：on_ready 打开，退出时关闭）
+_http_client: Optional[httpx.AsyncClient] = None
+
+# 进程级 JSON 编解码器（orjson / msgspec / json）
+json_codec = get_json_codec(DIRECTUS_JSON_CODEC)
+_ACCEPT_ENCODING = "br, gzip" if brotli_available() else "gzip"
+
+# 按端点维护的延迟统计与熔断器
+_latencies: Dict[str, LatencyTracker] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+# ==================== Metrics ====================
+
+DIRECTUS_LATENCY = Histogram(
+    "directus_request_duration_seconds", "Directus 请求延迟", ("collection", "method")
+)
+DIRECTUS_RESPONSES = Counter(
+    "directus_responses_total", "Directus 响应数（按状态码，传输错误记为 error）",
+    ("collection", "method", "status")
+)
+DIRECTUS_REQUEST_BYTES = Histogram(
+    "directus_request_bytes", "Directus 请求体大小（压缩后）", ("collection", "method"), SIZE_BUCKETS
+)
+DIRECTUS_RESPONSE_BYTES = Histogram(
+    "directus_response_bytes", "Directus 响应体大小（解压后）", ("collection", "method"), SIZE_BUCKETS
+)
+DIRECTUS_INFLIGHT = Gauge("directus_inflight_requests", "在途 Directus 请求数")
+Gauge(
+    "directus_pool_max_connections", "连接池最大连接数",
+    callback=lambda: {(): DIRECTUS_MAX_CONNECTIONS}
+)
+Gauge(
+    "directus_circuit_open", "端点熔断器是否处于打开/半开状态", ("endpoint",),
+    callback=lambda: {
+        (key,): 0 if breaker.state == CircuitBreaker.CLOSED else 1
+        for key, breaker in _breakers.items()
+    }
+)
+SINGLEFLIGHT_REQUESTS = Counter(
+    "directus_singleflight_requests_total", "相同 GET 合并统计（hits 为复用在途请求）", ("result",)
+)
+Gauge(
+    "directus_write_behind_pending", "写后缓冲积压行数", ("collection",),
+    callback=lambda: {(name,): queue.pending for name, queue in _write_queues.items()}
+)
+Gauge(
+    "directus_outbox_pending", "outbox 待回放写入数",
+    callback=lambda: {(): _outbox.pending_count()} if _outbox is not None else {}
+)
+
+
+def _metric_labels(key: str) -> Tuple[str, str]:
+    """"GET /items/suppliers" -> ("suppliers", "GET")"""
+    method, path = key.split(" ", 1)
+    parts = path.strip("/").split("/")
+    collection = parts[1] if parts[0] == "items" and len(parts) > 1 else parts[0]
+    return collection, method
+
+
+# 单飞（single-flight）：相同 GET 共享同一个进行中的请求
+_inflight: Dict[str, asyncio.Future] = {}
+
+# 进程级写后缓冲队列（collection -> queue）
+_write_queues: Dict[str, "WriteBehindQueue"] = {}
+
+# 供应商本地索引及其后台同步任务
+supplier_index = SupplierIndex()
+_supplier_sync_task: Optional[asyncio.Task] = None
+
+# 本地 outbox 及其后台回放任务
+_outbox: Optional[Outbox] = None
+_outbox_task: Optional[asyncio.Task] = None
+_outbox_wakeup: Optional[asyncio.Event] = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要可选依赖 h2（httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+async def init_directus() -> None:
+    """
+    打开进程级 Directus 连接池并启动写后缓冲（幂等，可在 on_ready 中重复调用）
+    
+    长连接 + keep-alive + HTTP/2 多路复用，避免每次调用重复 TCP/TLS 握手
+    """
+    global _http_client, _supplier_sync_task, _outbox, _outbox_task, _outbox_wakeup
+    
+    if OUTBOX_ENABLED and _outbox is None:
+        _outbox = Outbox(OUTBOX_PATH)
+        _outbox_wakeup = asyncio.Event()
+        _outbox_task = asyncio.create_task(_replay_outbox_forever())
+        pending = _outbox.pending_count()
+        if pending:
+            print(f"📤 outbox 中有 {pending} 条待同步写入")
+    
+    if SUPPLIER_SYNC_ENABLED and _supplier_sync_task is None:
+        _supplier_sync_task = asyncio.create_task(_sync_suppliers_forever())
+    
+    for collection in WRITE_BEHIND_COLLECTIONS:
+        if collection not in _write_queues:
+            queue = WriteBehindQueue(collection)
+            queue.start()
+            _write_queues[collection] = queue
+    
+    if _http_client is not None and not _http_client.is_closed:
+        return
+    
+    http2 = DIRECTUS_HTTP2 and _http2_available()
+    _http_client = httpx.AsyncClient(
+        timeout=DIRECTUS_TIMEOUT,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=DIRECTUS_MAX_CONNECTIONS,
+            max_keepalive_connections=DIRECTUS_MAX_KEEPALIVE,
+            keepalive_expiry=DIRECTUS_KEEPALIVE_EXPIRY
+        )
+    )
+    print(f"🔌 Directus 连接池已打开 (HTTP/{'2' if http2 else '1.1'}, max={DIRECTUS_MAX_CONNECTIONS})")
+
+
+async def close_directus() -> None:
+    """停止后台任务、刷新写后缓冲并关闭进程级 Directus 连接池"""
+    global _http_client, _supplier_sync_task, _outbox, _outbox_task, _outbox_wakeup
+    
+    for task in (_supplier_sync_task, _outbox_task):
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    _supplier_sync_task = None
+    _outbox_task = None
+    
+    # 未回放的写入保留在 SQLite 中，下次启动继续回放
+    if _outbox is not None:
+        _outbox.close()
+        _outbox = None
+        _outbox_wakeup = None
+    
+    # 先刷新缓冲区，保证退出前数据落库
+    while _write_queues:
+        _, queue = _write_queues.popitem()
+        await queue.close()
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _endpoint_key(method: str, endpoint: str) -> str:
+    """按 方法 + 集合 归类端点（去掉查询串和主键），如 "GET /items/suppliers" """
+    path = endpoint.split("?", 1)[0]
+    parts = path.strip("/").split("/")
+    if parts[0] == "items" and len(parts) > 2:
+        parts = parts[:2]
+    return f"{method} /{'/'.join(parts)}"
+
+
+def _is_retryable(method: str, response: Optional[httpx.Response], error: Optional[Exception]) -> bool:
+    """
+    判断失败是否可重试
+    
+    POST 非幂等：只在请求确定未被处理时重试（连接失败 / 429 / 503）；
+    GET / PATCH / DELETE 对超时和 5xx 也重试
+    """
+    if error is not None:
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return method != "POST" and isinstance(error, httpx.TransportError)
+    
+    if response.status_code in (429, 503):
+        return True
+    return method != "POST" and response.status_code in (500, 502, 504)
+
 
 class DirectusClient:
-    """异步 Directus API 客户端"""
+    """
+    异步 Directus API 客户端
+    
+    每个端点（方法 + 集合）独立维护延迟统计与熔断器：
+    - 写请求携带 Idempotency-Key，按抖动退避重试
+    - GET 在超过该端点 p95 延迟仍未返回时发出一次对冲请求，取先返回者
+    - 连续失败后熔断，直接快速失败，不再占用 worker
+    """
     
     def __init__(self):
         self.base_url = DIRECTUS_URL
         self.headers = {
             "Authorization": f"Bearer {DIRECTUS_TOKEN}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": _ACCEPT_ENCODING
         }
+        # 最近一次写请求的 HTTP 状态码（网络错误 / 熔断时为 None），供 outbox 回放区分可重试错误
+        self.last_status: Optional[int] = None
     
-    async def _request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Optional[Dict]:
-        """通用请求方法"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            url = f"{self.base_url}{endpoint}"
-            
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[httpx.AsyncClient]:
+        client = _http_client
+        if client is None or client.is_closed:
+            # 连接池未打开（脚本等场景），退化为一次性客户端
+            async with httpx.AsyncClient(timeout=DIRECTUS_TIMEOUT) as client:
+                yield client
+        else:
+            yield client
+    
+    async def _request(self, method: str, endpoint: str, data: Optional[Any] = None) -> Optional[Dict]:
+        """通用请求方法（失败返回 None）"""
+        if method not in ("GET", "POST", "PATCH", "DELETE"):
+            return None
+        
+        if method == "GET":
+            return await self._coalesced_get(endpoint)
+        return await self._resilient_request(method, endpoint, data)
+    
+    async def _coalesced_get(self, endpoint: str) -> Optional[Dict]:
+        """
+        合并相同的并发 GET：同一 URL 已有请求在途时直接等待其结果
+        
+        结果对象在调用方之间共享，调用方不应原地修改
+        """
+        key = f"GET {self.base_url}{endpoint}"
+        
+        future = _inflight.get(key)
+        if future is not None:
+            SINGLEFLIGHT_REQUESTS.inc("hits")
             try:
-                if method == "GET":
-                    response = await client.get(url, headers=self.headers)
-                elif method == "POST":
-                    response = await client.post(url, headers=self.headers, json=data)
-                elif method == "PATCH":
-                    response = await client.patch(url, headers=self.headers, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=self.headers)
-                else:
-                    return None
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 发起方被取消而非自身被取消：自己重新请求
+                if not future.cancelled():
+                    raise
+                return await self._resilient_request("GET", endpoint)
+        
+        SINGLEFLIGHT_REQUESTS.inc("misses")
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        
+        try:
+            result = await self._resilient_request("GET", endpoint)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            _inflight.pop(key, None)
+    
+    async def _resilient_request(self, method: str, endpoint: str, data: Optional[Any] = None) -> Optional[Dict]:
+        """带重试 / 对冲 / 熔断的请求"""
+        key = _endpoint_key(method, endpoint)
+        breaker = _breakers.setdefault(
+            key, CircuitBreaker(DIRECTUS_BREAKER_THRESHOLD, DIRECTUS_BREAKER_RESET)
+        )
+        
+        self.last_status = None
+        if not breaker.allow():
+            print(f"⚡ Directus 熔断中，快速失败: {key}")
+            return None
+        # 本次请求是否持有 half-open 的探测名额（退出时必须归还）
+        probe = breaker.probing
+        
+        try:
+            return await self._attempt_request(breaker, key, method, endpoint, data)
+        finally:
+            if probe and breaker.probing:
+                breaker.release_probe()
+    
+    async def _attempt_request(
+        self,
+        breaker: CircuitBreaker,
+        key: str,
+        method: str,
+        endpoint: str,
+        data: Optional[Any]
+    ) -> Optional[Dict]:
+        headers = self.headers
+        content = None
+        if method != "GET":
+            # 同一逻辑写入的所有重试共用一个幂等键
+            headers = {**headers, "Idempotency-Key": str(uuid.uuid4())}
+            content = self._encode(data, headers)
+        
+        response: Optional[httpx.Response] = None
+        error: Optional[Exception] = None
+        
+        async with self._client() as client:
+            for attempt in range(DIRECTUS_MAX_RETRIES + 1):
+                if attempt > 0:
+                    await asyncio.sleep(backoff_delay(attempt - 1))
+                    if not breaker.allow():
+                        break
+                
+                response, error = None, None
+                try:
+                    if method == "GET":
+                        response = await self._hedged_get(client, key, endpoint, headers)
+                    else:
+                        response = await self._send(client, key, method, endpoint, headers, content)
+                except httpx.HTTPError as e:
+                    error = e
                 
-                if response.status_code in [200, 201, 204]:
-                    if response.status_code == 204:
-                        return {"success": True}
-                    return response.json()
-                else:
-                    print(f"❌ Directus Error [{response.status_code}]: {response.text}")
-                    return None
-                    
+                if response is not None and response.status_code < 500 and response.status_code != 429:
+                    # 4xx 属于调用方问题，后端本身是健康的
+                    breaker.record_success()
+                    self.last_status = response.status_code
+                    return self._parse(response)
+                
+                breaker.record_failure()
+                if not _is_retryable(method, response, error):
+                    break
+        
+        if response is not None:
+            self.last_status = response.status_code
+            return self._parse(response)
+        print(f"❌ Request Error: {str(error)}")
+        return None
+    
+    async def _send(
+        self,
+        client: httpx.AsyncClient,
+        key: str,
+        method: str,
+        endpoint: str,
+        headers: Dict[str, str],
+        content: Optional[bytes] = None
+    ) -> httpx.Response:
+        """发送单次请求，记录延迟、状态码与载荷大小"""
+        labels = _metric_labels(key)
+        if content:
+            DIRECTUS_REQUEST_BYTES.observe(*labels, value=len(content))
+        
+        DIRECTUS_INFLIGHT.inc()
+        started = time.monotonic()
+        try:
+            response = await client.request(
+                method,
+                f"{self.base_url}{endpoint}",
+                headers=headers,
+                content=content
+            )
+        except httpx.HTTPError:
+            DIRECTUS_RESPONSES.inc(*labels, "error")
+            raise
+        finally:
+            DIRECTUS_INFLIGHT.dec()
+        
+        elapsed = time.monotonic() - started
+        DIRECTUS_LATENCY.observe(*labels, value=elapsed)
+        DIRECTUS_RESPONSES.inc(*labels, str(response.status_code))
+        DIRECTUS_RESPONSE_BYTES.observe(*labels, value=len(response.content))
+        
+        if response.status_code < 500:
+            _latencies.setdefault(key, LatencyTracker()).record(elapsed)
+        return response
+    
+    async def _hedged_get(
+        self,
+        client: httpx.AsyncClient,
+        key: str,
+        endpoint: str,
+        headers: Dict[str, str]
+    ) -> httpx.Response:
+        """GET 对冲：超过 p95 延迟未返回时再发一份，取先成功者"""
+        tracker = _latencies.get(key)
+        p95 = tracker.percentile(0.95) if tracker else None
+        
+        primary = asyncio.create_task(self._send(client, key, "GET", endpoint, headers))
+        if p95 is None:
+            return await primary
+        
+        done, _ = await asyncio.wait({primary}, timeout=max(p95, DIRECTUS_HEDGE_MIN_DELAY))
+        if done:
+            return primary.result()
+        
+        hedge = asyncio.create_task(self._send(client, key, "GET", endpoint, headers))
+        pending = {primary, hedge}
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code < 500:
+                        return task.result()
+            # 两份都失败：返回/抛出最后一个结果
+            return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    @staticmethod
+    def _encode(data: Optional[Any], headers: Dict[str, str]) -> Optional[bytes]:
+        """编码请求体；超过阈值时 gzip 压缩并设置 Content-Encoding"""
+        if data is None:
+            return None
+        
+        body = json_codec.dumps(data)
+        if DIRECTUS_REQUEST_GZIP and len(body) >= DIRECTUS_GZIP_MIN_BYTES:
+            body = gzip_body(body)
+            headers["Content-Encoding"] = "gzip"
+        return body
+    
+    @staticmethod
+    def _parse(response: httpx.Response) -> Optional[Dict]:
+        if response.status_code in [200, 201, 204]:
+            if response.status_code == 204:
+                return {"success": True}
+            # response.content 已由 httpx 按 Content-Encoding 解压
+            return json_codec.loads(response.content)
+        
+        print(f"❌ Directus Error [{response.status_code}]: {response.text}")
+        return None
+    
+    def batch(self) -> "GraphQLBatch":
+        """创建 GraphQL 批量请求，把多个读写合并为最少的 HTTP 往返"""
+        return GraphQLBatch(self)
+
+
+class GraphQLBatch:
+    """
+    Directus GraphQL 批量请求
+    
+    每个操作使用别名区分；所有读操作合并为一个 query 文档，所有写操作合并为
+    一个 mutation 文档（GraphQL 单次请求只执行一种操作类型），两者并发发送，
+    因此任意数量的读写最多只需 2 次 HTTP 请求。
+    
+    用法:
+        batch = DirectusClient().batch()
+        batch.query("history", "sourcing_requests",
+                    fields=["id", "product_name", "status"],
+                    filter={"user_id": {"_eq": user_id}}, sort=["-date_created"], limit=5)
+        batch.create("record", "sourcing_requests", data)
+        results = await batch.execute()   # {"history": [...], "record": {"id": ...}}
+    """
+    
+    def __init__(self, client: DirectusClient):
+        self._client = client
+        self._reads: List[str] = []
+        self._writes: List[str] = []
+        self._read_vars: Dict[str, Tuple[str, Any]] = {}
+        self._write_vars: Dict[str, Tuple[str, Any]] = {}
+    
+    def query(
+        self,
+        alias: str,
+        collection: str,
+        fields: List[str],
+        filter: Optional[Dict[str, Any]] = None,
+        sort: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> "GraphQLBatch":
+        """列表查询，结果为 List[Dict]"""
+        args = self._args(self._read_vars, alias, [
+            ("filter", f"{collection}_filter", filter),
+            ("sort", "[String]", sort),
+            ("limit", "Int", limit)
+        ])
+        self._reads.append(f"{alias}: {collection}{args} {self._selection(fields)}")
+        return self
+    
+    def get(self, alias: str, collection: str, item_id: str, fields: List[str]) -> "GraphQLBatch":
+        """按主键查询，结果为 Dict 或 None"""
+        args = self._args(self._read_vars, alias, [("id", "ID!", item_id)])
+        self._reads.append(f"{alias}: {collection}_by_id{args} {self._selection(fields)}")
+        return self
+    
+    def create(
+        self,
+        alias: str,
+        collection: str,
+        data: Dict[str, Any],
+        fields: Optional[List[str]] = None
+    ) -> "GraphQLBatch":
+        """创建单条记录，结果为 Dict（默认只返回 id）"""
+        args = self._args(self._write_vars, alias, [("data", f"create_{collection}_input!", data)])
+        self._writes.append(f"{alias}: create_{collection}_item{args} {self._selection(fields or ['id'])}")
+        return self
+    
+    def update(
+        self,
+        alias: str,
+        collection: str,
+        item_id: str,
+        data: Dict[str, Any],
+        fields: Optional[List[str]] = None
+    ) -> "GraphQLBatch":
+        """更新单条记录，结果为 Dict（默认只返回 id）"""
+        args = self._args(self._write_vars, alias, [
+            ("id", "ID!", item_id),
+            ("data", f"update_{collection}_input!", data)
+        ])
+        self._writes.append(f"{alias}: update_{collection}_item{args} {self._selection(fields or ['id'])}")
+        return self
+    
+    async def execute(self) -> Dict[str, Any]:
+        """
+        发送批量请求，返回 {别名: 结果}
+        
+        单个操作出错（GraphQL errors 中带 path）时该别名结果为 None，不影响其他操作
+        """
+        documents = []
+        if self._reads:
+            documents.append(("query", self._reads, self._read_vars))
+        if self._writes:
+            documents.append(("mutation", self._writes, self._write_vars))
+        
+        responses = await asyncio.gather(*[
+            self._send(operation, fields, variables)
+            for operation, fields, variables in documents
+        ])
+        
+        results: Dict[str, Any] = {}
+        for response in responses:
+            results.update(response)
+        return results
+    
+    async def _send(
+        self,
+        operation: str,
+        fields: List[str],
+        variables: Dict[str, Tuple[str, Any]]
+    ) -> Dict[str, Any]:
+        aliases = [field.split(":", 1)[0] for field in fields]
+        declarations = ", ".join(f"${name}: {gql_type}" for name, (gql_type, _) in variables.items())
+        header = f"{operation} Batch({declarations})" if declarations else operation
+        
+        result = await self._client._request("POST", "/graphql", {
+            "query": f"{header} {{ {' '.join(fields)} }}",
+            "variables": {name: value for name, (_, value) in variables.items()}
+        })
+        
+        if not result:
+            return {alias: None for alias in aliases}
+        
+        data = result.get("data") or {}
+        failed = {
+            error["path"][0]
+            for error in result.get("errors", [])
+            if error.get("path")
+        }
+        for error in result.get("errors", []):
+            print(f"❌ Directus GraphQL Error: {error.get('message')}")
+        
+        return {
+            alias: None if alias in failed else data.get(alias)
+            for alias in aliases
+        }
+    
+    @staticmethod
+    def _args(
+        variables: Dict[str, Tuple[str, Any]],
+        alias: str,
+        params: List[Tuple[str, str, Any]]
+    ) -> str:
+        """以 "<别名>_<参数名>" 登记变量，返回参数列表字符串"""
+        args = []
+        for name, gql_type, value in params:
+            if value is None:
+                continue
+            var = f"{alias}_{name}"
+            variables[var] = (gql_type, value)
+            args.append(f"{name}: ${var}")
+        return f"({', '.join(args)})" if args else ""
+    
+    @staticmethod
+    def _selection(fields: List[str]) -> str:
+        return "{ " + " ".join(fields) + " }"
+
+
+class WriteBehindQueue:
+    """
+    写后缓冲队列
+    
+    按集合聚合写入，数量达到 batch_size 或等待超过 flush_interval 时，
+    以 Directus 批量数组 POST 一次写入。
+    - 有界：积压超过 max_pending 时 put() 阻塞调用方（背压）
+    - 关闭时刷新剩余数据
+    """
+    
+    _STOP = object()
+    
+    def __init__(
+        self,
+        collection: str,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """启动后台刷新任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+    
+    async def put(self, row: Dict[str, Any]) -> None:
+        """加入一行待写数据（缓冲区满时等待）"""
+        await self._queue.put(row)
+    
+    async def close(self) -> None:
+        """停止接收并刷新所有剩余数据"""
+        if self._task is None:
+            return
+        if self._task.done():
+            # 刷新任务已意外退出：队列可能已满，放入停止标记会永久阻塞
+            if self.pending:
+                print(f"❌ 写后刷新任务已退出，丢弃 {self.pending} 条 {self.collection} 记录")
+        else:
+            await self._queue.put(self._STOP)
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+    
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            row = await self._queue.get()
+            if row is self._STOP:
+                break
+            
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is self._STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # 非 HTTP 异常（如无法序列化的字段）不能终止刷新任务，否则 put() 会在队列满后永久阻塞
+                print(f"❌ 批量写入异常 ({type(e).__name__}: {e})，逐条重试 {len(batch)} 条 {self.collection} 记录")
+                await self._flush_each(batch)
+    
+    async def _flush_each(self, batch: List[Dict[str, Any]]) -> None:
+        """逐条写入，只丢弃本身无法写入的记录"""
+        for row in batch:
+            try:
+                await self._flush([row])
             except Exception as e:
-                print(f"❌ Request Error: {str(e)}")
-                return None
+                print(f"❌ 丢弃 1 条无法写入的 {self.collection} 记录: {type(e).__name__}: {e}")
+    
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        # 重试由 DirectusClient 的弹性策略负责
+        client = DirectusClient()
+        result = await client._request("POST", f"/items/{self.collection}", batch)
+        if result is not None:
+            return
+        
+        print(f"❌ 批量写入失败，丢弃 {len(batch)} 条 {self.collection} 记录")
+
+
+async def _write_behind(collection: str, row: Dict[str, Any]) -> bool:
+    """若写后缓冲已启动，则加入队列并返回 True"""
+    queue = _write_queues.get(collection)
+    if queue is None:
+        return False
+    await queue.put(row)
+    return True
+
+
+# ==================== Pagination ====================
+
+def _build_endpoint(collection: str, params: Dict[str, Any]) -> str:
+    """拼接 /items 查询（filter 以 JSON 形式传递）"""
+    query = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        elif isinstance(value, (list, tuple)):
+            value = ",".join(value)
+        query[key] = value
+    return f"/items/{collection}?{urlencode(query)}"
+
+
+async def iter_items(
+    collection: str,
+    filter: Optional[Dict[str, Any]] = None,
+    fields: Optional[List[str]] = None,
+    sort_field: str = "date_created",
+    descending: bool = True,
+    page_size: int = 200
+) -> AsyncIterator[Dict]:
+    """
+    以游标（keyset）分页流式遍历任意集合
+    
+    按 (sort_field, id) 排序，下一页以上一页最后一行为游标过滤，
+    避免 offset 分页在深页上的全表扫描；消费当前页时已在后台预取下一页，
+    内存占用与总行数无关。
+    
+    Args:
+        collection: 集合名，如 "sourcing_requests"
+        filter: Directus filter 对象，如 {"user_id": {"_eq": "123"}}
+        fields: 字段投影（会自动补上 id 与 sort_field）
+        sort_field: 游标排序字段，默认 date_created
+        descending: 是否倒序（新 -> 旧）
+        page_size: 每页行数
+    
+    用法:
+        async for item in iter_items("messages", fields=["id", "content"]):
+            ...
+    """
+    client = DirectusClient()
+    
+    if fields:
+        fields = list(dict.fromkeys([*fields, "id", sort_field]))
+    
+    op = "_lt" if descending else "_gt"
+    prefix = "-" if descending else ""
+    sort = [f"{prefix}{sort_field}", f"{prefix}id"]
+    
+    async def fetch_page(cursor: Optional[Dict]) -> Optional[List[Dict]]:
+        conditions = [filter] if filter else []
+        if cursor is not None:
+            conditions.append({"_or": [
+                {sort_field: {op: cursor[sort_field]}},
+                {"_and": [
+                    {sort_field: {"_eq": cursor[sort_field]}},
+                    {"id": {op: cursor["id"]}}
+                ]}
+            ]})
+        
+        endpoint = _build_endpoint(collection, {
+            "filter": {"_and": conditions} if conditions else None,
+            "fields": fields,
+            "sort": sort,
+            "limit": page_size
+        })
+        result = await client._request("GET", endpoint)
+        
+        if result and "data" in result:
+            return result["data"]
+        return None
+    
+    next_page: Optional[asyncio.Task] = asyncio.create_task(fetch_page(None))
+    
+    try:
+        while next_page is not None:
+            page = await next_page
+            next_page = None
+            
+            if not page:
+                return
+            
+            # 满页时立即预取下一页，与当前页的消费并行
+            if len(page) >= page_size:
+                next_page = asyncio.create_task(fetch_page(page[-1]))
+            
+            for item in page:
+                yield item
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+# ==================== Outbox ====================
+
+# 回放时仍可重试的 4xx（超时 / 冲突 / 限流）；其余 4xx 直接转入死信
+OUTBOX_RETRYABLE_4XX = (408, 409, 429)
+
+
+async def replay_outbox() -> bool:
+    """
+    按写入顺序回放 outbox
+    
+    遇到失败即停止以保证顺序（超过最大次数或被 Directus 确定性拒绝的记录转入死信后继续），
+    返回 outbox 是否已清空
+    """
+    if _outbox is None:
+        return True
+    
+    client = DirectusClient()
+    
+    while True:
+        entry = _outbox.head()
+        if entry is None:
+            return True
+        
+        result = await client._request(entry["method"], entry["endpoint"], entry["payload"])
+        status = client.last_status
+        
+        if result is None and entry["method"] == "POST" and entry["item_id"]:
+            # 上次回放可能已写入成功但响应丢失（主键冲突），确认记录存在即视为成功
+            result = await client._request(
+                "GET", f"{entry['endpoint']}/{entry['item_id']}?fields=id"
+            )
+        
+        if result is None and status is not None and 400 <= status < 500 and status not in OUTBOX_RETRYABLE_4XX:
+            # 校验 / 权限等确定性拒绝重试也不会成功，直接转入死信，避免堵住后续记录
+            _outbox.mark_dead(entry["seq"], f"Directus 拒绝写入 [{status}]")
+            print(f"❌ outbox 记录 #{entry['seq']} 被 Directus 拒绝 [{status}]，已转入死信")
+            continue
+        
+        if result is None:
+            # 网络错误 / 5xx / 429 / 冲突：计入重试次数
+            if _outbox.mark_failed(entry["seq"], "Directus 写入失败", OUTBOX_MAX_ATTEMPTS):
+                print(f"❌ outbox 记录 #{entry['seq']} 多次回放失败，已转入死信")
+                continue
+            return False
+        
+        _outbox.ack(entry["seq"])
+
+
+async def _replay_outbox_forever() -> None:
+    """后台任务：有新写入时立即回放，失败时按间隔重试"""
+    while True:
+        try:
+            await replay_outbox()
+        except Exception as e:
+            print(f"❌ outbox 回放失败: {str(e)}")
+        
+        try:
+            await asyncio.wait_for(_outbox_wakeup.wait(), OUTBOX_RETRY_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _outbox_wakeup.clear()
+
+
+def _enqueue_outbox(method: str, endpoint: str, payload: Dict[str, Any], item_id: str) -> None:
+    _outbox.enqueue(method, endpoint, payload, item_id)
+    _outbox_wakeup.set()
 
 
 # ==================== Sourcing Requests ====================
 
+# 列表类热读取的默认字段（不含体积较大的 visual_analysis）
+SOURCING_SUMMARY_FIELDS = [
+    "id", "status", "platform", "user_id", "user_name", "product_name",
+    "video_url", "quote_price_usd", "date_created"
+]
+
 async def create_sourcing_request(data: Dict[str, Any]) -> Optional[Dict]:
     """
     将 Discord 收到的询盘写入 Directus
@@ -71,7 +942,20 @@ async def create_sourcing_request(data: Dict[str, Any]) -> Optional[Dict]:
             "status": "draft" | "processing" | "quoted" | "completed",
             "quote_price_usd": float
         }
+    
+    outbox 启用时在本地生成 UUID 主键并落盘后立即返回，
+    由后台任务异步写入 Directus（主键不变，无需回填）
     """
+    if not DIRECTUS_STORE_RAW_ANALYSIS and isinstance(data.get("visual_analysis"), dict):
+        visual_analysis = {k: v for k, v in data["visual_analysis"].items() if k != "raw_analysis"}
+        data = {**data, "visual_analysis": visual_analysis}
+    
+    if _outbox is not None:
+        record = {"id": str(uuid.uuid4()), **data}
+        _enqueue_outbox("POST", "/items/sourcing_requests", record, record["id"])
+        print(f"✅ 询盘已创建（待同步）: #{record['id']}")
+        return record
+    
     client = DirectusClient()
     result = await client._request("POST", "/items/sourcing_requests", data)
     
@@ -82,7 +966,11 @@ async def create_sourcing_request(data: Dict[str, Any]) -> Optional[Dict]:
 
 
 async def update_sourcing_request(request_id: str, data: Dict[str, Any]) -> Optional[Dict]:
-    """更新询盘状态或报价"""
+    """更新询盘状态或报价（记录仍在 outbox 中时排在创建之后回放）"""
+    if _outbox is not None and _outbox.is_pending(request_id):
+        _enqueue_outbox("PATCH", f"/items/sourcing_requests/{request_id}", data, request_id)
+        return {**data, "id": request_id}
+    
     client = DirectusClient()
     result = await client._request("PATCH", f"/items/sourcing_requests/{request_id}", data)
     
@@ -91,8 +979,156 @@ async def update_sourcing_request(request_id: str, data: Dict[str, Any]) -> Opti
     return None
 
 
+async def _patch_chunks(
+    collection: str,
+    bodies: List[Any],
+    concurrency: int
+) -> List[Dict]:
+    """并发（受限）发送批量 PATCH，返回所有成功更新的记录"""
+    client = DirectusClient()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def send(body: Any) -> List[Dict]:
+        async with semaphore:
+            result = await client._request("PATCH", f"/items/{collection}", body)
+        if result and isinstance(result.get("data"), list):
+            return result["data"]
+        print(f"❌ 批量更新失败: {collection} 一批记录未更新")
+        return []
+    
+    updated: List[Dict] = []
+    for chunk in await asyncio.gather(*[send(body) for body in bodies]):
+        updated.extend(chunk)
+    return updated
+
+
+def _split_pending(request_ids: List[str]) -> Tuple[List[str], List[str]]:
+    """拆分出仍在 outbox 中未同步的记录（它们需排在创建之后回放）"""
+    if _outbox is None:
+        return list(request_ids), []
+    synced, pending = [], []
+    for request_id in request_ids:
+        (pending if _outbox.is_pending(request_id) else synced).append(request_id)
+    return synced, pending
+
+
+async def bulk_update_sourcing_requests(
+    request_ids: List[str],
+    data: Dict[str, Any],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    concurrency: int = BULK_CONCURRENCY
+) -> List[Dict]:
+    """
+    将同一份 data 应用到多条询盘（Directus keys 批量 PATCH）
+    
+    按 chunk_size 分批，最多 concurrency 批并发
+    """
+    synced, pending = _split_pending(request_ids)
+    for request_id in pending:
+        _enqueue_outbox("PATCH", f"/items/sourcing_requests/{request_id}", data, request_id)
+    
+    bodies = [
+        {"keys": synced[i:i + chunk_size], "data": data}
+        for i in range(0, len(synced), chunk_size)
+    ]
+    updated = await _patch_chunks("sourcing_requests", bodies, concurrency)
+    return updated + [{**data, "id": request_id} for request_id in pending]
+
+
+async def bulk_update_sourcing_requests_items(
+    items: List[Dict[str, Any]],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    concurrency: int = BULK_CONCURRENCY
+) -> List[Dict]:
+    """
+    逐条不同数据的批量更新（如为每条询盘写入 matched_factories）
+    
+    items 中每项必须包含 id
+    """
+    by_id = {item["id"]: item for item in items}
+    synced, pending = _split_pending(list(by_id))
+    for request_id in pending:
+        _enqueue_outbox("PATCH", f"/items/sourcing_requests/{request_id}", by_id[request_id], request_id)
+    
+    rows = [by_id[request_id] for request_id in synced]
+    bodies = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    updated = await _patch_chunks("sourcing_requests", bodies, concurrency)
+    return updated + [by_id[request_id] for request_id in pending]
+
+
+async def update_sourcing_requests_by_filter(
+    filter: Dict[str, Any],
+    data: Dict[str, Any]
+) -> List[Dict]:
+    """
+    按 filter 一次性更新（单个请求，适合数量可控的集合）
+    
+    大批量请使用 transition_sourcing_requests_status，按主键分批执行
+    """
+    body = {"query": {"filter": filter, "limit": -1}, "data": data}
+    return await _patch_chunks("sourcing_requests", [body], 1)
+
+
+async def transition_sourcing_requests_status(
+    from_status: str,
+    to_status: str,
+    filter: Optional[Dict[str, Any]] = None,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    concurrency: int = BULK_CONCURRENCY
+) -> int:
+    """
+    批量状态流转，如 quoted -> completed
+    
+    以游标分页只取主键，每凑满一批即发出 keys 批量 PATCH（受 concurrency 限制），
+    返回成功更新的记录数
+    """
+    conditions = [{"status": {"_eq": from_status}}]
+    if filter:
+        conditions.append(filter)
+    
+    data = {"status": to_status}
+    running: set = set()
+    updated = 0
+    
+    async def flush(keys: List[str]) -> None:
+        nonlocal updated, running
+        # 在途批次达到上限时先等待，保证内存与并发都有界
+        while len(running) >= max(1, concurrency):
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            updated += sum(task.result() for task in done)
+        running.add(asyncio.create_task(_count_updated(keys, data, chunk_size)))
+    
+    keys: List[str] = []
+    async for item in iter_items(
+        "sourcing_requests",
+        filter={"_and": conditions},
+        fields=["id"],
+        page_size=chunk_size
+    ):
+        keys.append(item["id"])
+        if len(keys) >= chunk_size:
+            await flush(keys)
+            keys = []
+    
+    if keys:
+        await flush(keys)
+    
+    if running:
+        updated += sum(await asyncio.gather(*running))
+    return updated
+
+
+async def _count_updated(keys: List[str], data: Dict[str, Any], chunk_size: int) -> int:
+    return len(await bulk_update_sourcing_requests(keys, data, chunk_size, 1))
+
+
 async def get_sourcing_request(request_id: str) -> Optional[Dict]:
-    """获取单个询盘详情"""
+    """获取单个询盘详情（尚未同步的记录返回本地视图）"""
+    if _outbox is not None:
+        pending = _outbox.pending_item(request_id)
+        if pending is not None:
+            return pending
+    
     client = DirectusClient()
     result = await client._request("GET", f"/items/sourcing_requests/{request_id}")
     
@@ -101,10 +1137,23 @@ async def get_sourcing_request(request_id: str) -> Optional[Dict]:
     return None
 
 
-async def get_user_sourcing_history(user_id: str, limit: int = 10) -> List[Dict]:
-    """获取用户的询盘历史"""
+async def get_user_sourcing_history(
+    user_id: str,
+    limit: int = 10,
+    fields: Optional[List[str]] = None
+) -> List[Dict]:
+    """
+    获取用户的询盘历史（全量遍历请用 iter_items）
+    
+    默认只取 SOURCING_SUMMARY_FIELDS；需要分析详情时传 fields=["*"]
+    """
     client = DirectusClient()
-    endpoint = f"/items/sourcing_requests?filter[user_id][_eq]={user_id}&limit={limit}&sort=-date_created"
+    endpoint = _build_endpoint("sourcing_requests", {
+        "filter[user_id][_eq]": user_id,
+        "fields": fields or SOURCING_SUMMARY_FIELDS,
+        "limit": limit,
+        "sort": "-date_created"
+    })
     result = await client._request("GET", endpoint)
     
     if result and "data" in result:
@@ -112,17 +1161,147 @@ async def get_user_sourcing_history(user_id: str, limit: int = 10) -> List[Dict]
     return []
 
 
+async def find_recent_video_analysis(video_id: str, max_age_seconds: float) -> Optional[Dict]:
+    """
+    按视频 ID 查找 max_age_seconds 内最近一次成功的分析结果（visual_analysis）
+    
+    供分析缓存的 Directus 共享层使用；video_url 需为包含 /video/<id> 的完整链接
+    """
+    since = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - max_age_seconds))
+    client = DirectusClient()
+    endpoint = _build_endpoint("sourcing_requests", {
+        "filter": {"_and": [
+            {"video_url": {"_contains": f"/video/{video_id}"}},
+            {"date_created": {"_gte": since}}
+        ]},
+        "fields": ["video_url", "visual_analysis"],
+        "limit": 5,
+        "sort": "-date_created"
+    })
+    result = await client._request("GET", endpoint)
+    
+    for row in (result or {}).get("data", []):
+        # _contains 是子串匹配，排除 ID 为前缀的其他视频
+        url = row.get("video_url") or ""
+        analysis = row.get("visual_analysis")
+        if re.search(rf"/video/{video_id}(?!\d)", url) and analysis and analysis.get("success") and not analysis.get("demo"):
+            return analysis
+    return None
+
+
 # ==================== Factory Matching ====================
 
-async def search_factory_match(keywords: str, category: Optional[str] = None) -> List[Dict]:
+# 工厂匹配缓存配置（stale-while-revalidate）
+FACTORY_CACHE_TTL = float(os.getenv("FACTORY_CACHE_TTL", "300"))
+FACTORY_CACHE_STALE_TTL = float(os.getenv("FACTORY_CACHE_STALE_TTL", "3600"))
+FACTORY_CACHE_MAX_ENTRIES = int(os.getenv("FACTORY_CACHE_MAX_ENTRIES", "256"))
+
+# 演示用模拟工厂（Directus 不可用且无缓存时返回）
+DEMO_FACTORIES = [
+    {
+        "id": "factory-001",
+        "name": "宁波星辰智造",
+        "name_en": "Ningbo Star Manufacturing",
+        "category": "Home Appliances",
+        "moq": 500,
+        "rating": 4.8,
+        "location": "浙江宁波",
+        "certifications": ["ISO9001", "CE", "FCC"]
+    },
+    {
+        "id": "factory-002", 
+        "name": "深圳前沿科技",
+        "name_en": "Shenzhen Frontier Tech",
+        "category": "Electronics",
+        "moq": 1000,
+        "rating": 4.9,
+        "location": "广东深圳",
+        "certifications": ["ISO9001", "CE", "RoHS"]
+    },
+    {
+        "id": "factory-003",
+        "name": "东莞精工模具",
+        "name_en": "Dongguan Precision Mold",
+        "category": "Plastic Products",
+        "moq": 300,
+        "rating": 4.7,
+        "location": "广东东莞",
+        "certifications": ["ISO9001", "BSCI"]
+    }
+]
+
+
+class StaleWhileRevalidateCache:
     """
-    在 Directus 的 suppliers 集合中查找匹配工厂
+    带 TTL 和 LRU 淘汰的异步结果缓存
     
-    实际项目中可以：
-    1. 使用 Directus 的全文搜索
-    2. 调用外部 AI 语义匹配服务
-    3. 查询预建的产品-工厂映射表
+    - age < ttl：直接返回
+    - ttl <= age < stale_ttl：返回旧值，并在后台刷新
+    - 加载失败（loader 返回 None）：有旧值则返回旧值（无论多旧）
     """
+    
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+    
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        
+        if entry is not None:
+            value, fetched_at = entry
+            self._entries.move_to_end(key)
+            age = time.monotonic() - fetched_at
+            
+            if age < self.ttl:
+                return value
+            if age < self.stale_ttl:
+                self._revalidate(key, loader)
+                return value
+        
+        value = await loader()
+        if value is None:
+            # 后端异常时优先返回旧值
+            return entry[0] if entry is not None else None
+        
+        self._store(key, value)
+        return value
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _revalidate(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        
+        async def refresh():
+            try:
+                value = await loader()
+                if value is not None:
+                    self._store(key, value)
+            finally:
+                self._refreshing.pop(key, None)
+        
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+
+_factory_cache = StaleWhileRevalidateCache(
+    ttl=FACTORY_CACHE_TTL,
+    stale_ttl=FACTORY_CACHE_STALE_TTL,
+    max_entries=FACTORY_CACHE_MAX_ENTRIES
+)
+
+
+async def _fetch_factory_match(category: Optional[str]) -> Optional[List[Dict]]:
+    """从 Directus 查询匹配工厂，失败返回 None"""
     client = DirectusClient()
     
     # 构建查询条件
@@ -135,40 +1314,81 @@ async def search_factory_match(keywords: str, category: Optional[str] = None) ->
     
     if result and "data" in result:
         return result["data"]
+    return None
+
+
+async def sync_suppliers(full: bool = False) -> bool:
+    """
+    同步供应商本地索引
+    
+    full=True 拉取完整快照重建索引（可感知删除）；
+    否则按 updated_at / created_at 水位线增量拉取
+    """
+    client = DirectusClient()
+    endpoint = "/items/suppliers?limit=-1&sort=updated_at"
+    
+    watermark = supplier_index.watermark
+    if not full and watermark:
+        marker = quote(watermark)
+        endpoint += (
+            f"&filter[_or][0][updated_at][_gt]={marker}"
+            f"&filter[_or][1][created_at][_gt]={marker}"
+        )
+    
+    result = await client._request("GET", endpoint)
+    if not result or "data" not in result:
+        return False
+    
+    if full or not supplier_index.ready:
+        supplier_index.load(result["data"])
+        print(f"🏭 供应商索引已加载: {len(supplier_index)} 家")
+    else:
+        supplier_index.apply(result["data"])
+    return True
+
+
+async def _sync_suppliers_forever() -> None:
+    """后台任务：启动时全量加载，之后定时增量同步，并周期性全量重建"""
+    loop = asyncio.get_running_loop()
+    next_full_sync = 0.0
+    
+    while True:
+        full = loop.time() >= next_full_sync
+        try:
+            if await sync_suppliers(full=full) and full:
+                next_full_sync = loop.time() + SUPPLIER_FULL_RESYNC_INTERVAL
+        except Exception as e:
+            print(f"❌ 供应商索引同步失败: {str(e)}")
+        await asyncio.sleep(SUPPLIER_SYNC_INTERVAL)
+
+
+async def search_factory_match(keywords: str, category: Optional[str] = None) -> List[Dict]:
+    """
+    查找匹配工厂
+    
+    供应商索引就绪时直接在本地倒排索引中检索，不访问网络；
+    否则回退到 Directus 的 suppliers 集合查询。
+    
+    远程结果按 category 缓存（远程查询不使用 keywords），过期后先返回旧值再后台刷新；
+    Directus 出错时返回旧值，只有完全没有缓存时才返回演示数据
+    
+    实际项目中可以：
+    1. 使用 Directus 的全文搜索
+    2. 调用外部 AI 语义匹配服务
+    3. 查询预建的产品-工厂映射表
+    """
+    if supplier_index.ready:
+        return supplier_index.search(keywords, category)
+    
+    # 远程查询只按类目过滤，缓存键也只用类目，避免同一结果按关键词重复缓存
+    key = (category or "").strip().lower()
+    factories = await _factory_cache.get(key, lambda: _fetch_factory_match(category))
+    
+    if factories is not None:
+        return factories
     
     # 如果没有找到，返回模拟数据（演示用）
-    return [
-        {
-            "id": "factory-001",
-            "name": "宁波星辰智造",
-            "name_en": "Ningbo Star Manufacturing",
-            "category": "Home Appliances",
-            "moq": 500,
-            "rating": 4.8,
-            "location": "浙江宁波",
-            "certifications": ["ISO9001", "CE", "FCC"]
-        },
-        {
-            "id": "factory-002", 
-            "name": "深圳前沿科技",
-            "name_en": "Shenzhen Frontier Tech",
-            "category": "Electronics",
-            "moq": 1000,
-            "rating": 4.9,
-            "location": "广东深圳",
-            "certifications": ["ISO9001", "CE", "RoHS"]
-        },
-        {
-            "id": "factory-003",
-            "name": "东莞精工模具",
-            "name_en": "Dongguan Precision Mold",
-            "category": "Plastic Products",
-            "moq": 300,
-            "rating": 4.7,
-            "location": "广东东莞",
-            "certifications": ["ISO9001", "BSCI"]
-        }
-    ]
+    return DEMO_FACTORIES
 
 
 # ==================== Discord Integration ====================
@@ -177,6 +1397,8 @@ async def create_discord_message(channel_id: str, data: Dict[str, Any]) -> Optio
     """
     存储 Discord 消息到 Directus（用于前端 Discord Clone 展示）
     
+    写后缓冲启动时异步批量写入，立即返回待写数据（不含 id）
+    
     Args:
         channel_id: 频道 ID
         data: {
@@ -194,6 +1416,9 @@ async def create_discord_message(channel_id: str, data: Dict[str, Any]) -> Optio
         **data
     }
     
+    if await _write_behind("messages", message_data):
+        return message_data
+    
     result = await client._request("POST", "/items/messages", message_data)
     
     if result and "data" in result:
@@ -201,10 +1426,19 @@ async def create_discord_message(channel_id: str, data: Dict[str, Any]) -> Optio
     return None
 
 
-async def get_channel_messages(channel_id: str, limit: int = 50) -> List[Dict]:
-    """获取频道消息历史"""
+async def get_channel_messages(
+    channel_id: str,
+    limit: int = 50,
+    fields: Optional[List[str]] = None
+) -> List[Dict]:
+    """获取频道消息历史（可用 fields 只取需要的字段；全量遍历请用 iter_items）"""
     client = DirectusClient()
-    endpoint = f"/items/messages?filter[channel_id][_eq]={channel_id}&limit={limit}&sort=-date_created"
+    endpoint = _build_endpoint("messages", {
+        "filter[channel_id][_eq]": channel_id,
+        "fields": fields,
+        "limit": limit,
+        "sort": "-date_created"
+    })
     result = await client._request("GET", endpoint)
     
     if result and "data" in result:
@@ -223,4 +1457,7 @@ async def log_agent_action(action_type: str, metadata: Dict[str, Any]) -> None:
         "metadata": metadata
     }
     
+    if await _write_behind("agent_logs", log_data):
+        return
+    
     await client._request("POST", "/items/agent_logs", log_data)
@@ -0,0 +1,378 @@
+"""
+Fake Directus - 本地 Directus 替身（用于压测与离线调试）
+实现 /items 的增删改查、filter / sort / limit / fields、批量数组写入，
+并支持注入延迟与错误
+
+用法:
+    python fake_directus.py --port 8055 --latency-ms 20 --jitter-ms 10 --error-rate 0.01
+"""
+
+import json
+import gzip
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+
+DEMO_SUPPLIERS = [
+    {
+        "name": "宁波星辰智造", "name_en": "Ningbo Star Manufacturing", "location": "浙江宁波",
+        "categories": ["家居用品", "消费电子"], "core_processes": ["注塑", "组装"],
+        "certifications": ["ISO9001", "CE", "FCC"], "moq": 500, "rating": 4.8
+    },
+    {
+        "name": "深圳前沿科技", "name_en": "Shenzhen Frontier Tech", "location": "广东深圳",
+        "categories": ["消费电子"], "core_processes": ["SMT贴片", "组装", "测试"],
+        "certifications": ["ISO9001", "CE", "RoHS"], "moq": 1000, "rating": 4.9
+    },
+    {
+        "name": "东莞精工模具", "name_en": "Dongguan Precision Mold", "location": "广东东莞",
+        "categories": ["家居用品", "工业材料"], "core_processes": ["注塑", "CNC加工"],
+        "certifications": ["ISO9001", "BSCI"], "moq": 300, "rating": 4.7
+    },
+]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+
+
+# ==================== Filter / Query ====================
+
+def _nest(pairs: List[Tuple[str, str]], prefix: str) -> Dict[str, Any]:
+    """把 filter[a][_eq]=1 形式的查询参数还原为嵌套字典"""
+    root: Dict[str, Any] = {}
+    for key, value in pairs:
+        if not key.startswith(prefix + "["):
+            continue
+        parts = key[len(prefix) + 1:-1].split("][")
+        node = root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = value
+    return root
+
+
+def _as_list(value: Any) -> List[Any]:
+    """_and / _or 既可能是列表，也可能是 {"0": ..., "1": ...}"""
+    if isinstance(value, dict):
+        return [value[k] for k in sorted(value, key=lambda k: int(k))]
+    return list(value)
+
+
+def _coerce(expected: Any, value: Any) -> Any:
+    """查询串中的值都是字符串，按字段实际类型转换"""
+    if not isinstance(value, str) or expected is None or isinstance(expected, str):
+        return value
+    if isinstance(expected, bool):
+        return value.lower() == "true"
+    if isinstance(expected, (int, float)):
+        try:
+            return type(expected)(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _match_op(actual: Any, op: str, expected: Any) -> bool:
+    if op == "_null":
+        return actual is None
+    if op == "_nnull":
+        return actual is not None
+    if op in ("_in", "_nin"):
+        values = expected.split(",") if isinstance(expected, str) else _as_list(expected)
+        hit = any(_coerce(actual, v) == actual for v in values)
+        return hit if op == "_in" else not hit
+
+    expected = _coerce(actual, expected)
+    if op == "_eq":
+        return actual == expected
+    if op == "_neq":
+        return actual != expected
+    if op in ("_contains", "_icontains"):
+        if actual is None:
+            return False
+        haystack = json.dumps(actual, ensure_ascii=False) if not isinstance(actual, str) else actual
+        if op == "_icontains":
+            return str(expected).lower() in haystack.lower()
+        return str(expected) in haystack
+    if actual is None:
+        return False
+    try:
+        if op == "_lt":
+            return actual < expected
+        if op == "_lte":
+            return actual <= expected
+        if op == "_gt":
+            return actual > expected
+        if op == "_gte":
+            return actual >= expected
+    except TypeError:
+        return False
+    raise ValueError(f"unsupported filter operator: {op}")
+
+
+def matches(item: Dict[str, Any], rule: Optional[Dict[str, Any]]) -> bool:
+    """按 Directus filter 规则匹配一条记录"""
+    if not rule:
+        return True
+    for key, condition in rule.items():
+        if key == "_and":
+            if not all(matches(item, sub) for sub in _as_list(condition)):
+                return False
+        elif key == "_or":
+            if not any(matches(item, sub) for sub in _as_list(condition)):
+                return False
+        else:
+            actual = item.get(key)
+            for op, expected in condition.items():
+                if not _match_op(actual, op, expected):
+                    return False
+    return True
+
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    # None 排在最前，且不同类型之间不互相比较
+    return (0, "") if value is None else (1, value)
+
+
+def apply_query(items: List[Dict[str, Any]], params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """对记录列表执行 filter / sort / offset / limit / fields"""
+    query = dict(params)
+
+    rule = json.loads(query["filter"]) if "filter" in query else _nest(params, "filter")
+    result = [item for item in items if matches(item, rule)]
+
+    for field in reversed([f for f in query.get("sort", "").split(",") if f]):
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        result.sort(key=lambda item: _sort_key(item.get(name)), reverse=descending)
+
+    limit = int(query.get("limit", 100))
+    offset = int(query.get("offset", 0))
+    if "page" in query and limit > 0:
+        offset = (int(query["page"]) - 1) * limit
+    result = result[offset:] if limit < 0 else result[offset:offset + limit]
+
+    return [project(item, query.get("fields")) for item in result]
+
+
+def project(item: Dict[str, Any], fields: Optional[str]) -> Dict[str, Any]:
+    if not fields or "*" in fields.split(","):
+        return dict(item)
+    return {name: item.get(name) for name in fields.split(",")}
+
+
+# ==================== Server ====================
+
+class FakeDirectus:
+    """内存数据存储 + 故障注入配置"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def seed(self, collection: str, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.insert(collection, {"status": "active", **row})
+
+    def insert(self, collection: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        store = self.collections.setdefault(collection, {})
+        item = {"id": str(uuid.uuid4()), **row}
+        item_id = str(item["id"])
+        if item_id in store:
+            raise KeyError(item_id)
+        now = _now()
+        item.setdefault("date_created", now)
+        item.setdefault("created_at", now)
+        store[item_id] = item
+        return item
+
+    def update(self, collection: str, item_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        item = self.collections.get(collection, {}).get(str(item_id))
+        if item is None:
+            return None
+        now = _now()
+        item.update(data)
+        item["date_updated"] = now
+        item["updated_at"] = now
+        return item
+
+    def inject(self) -> bool:
+        """模拟延迟；返回 True 表示本次请求应注入错误"""
+        with self._lock:
+            self.request_count += 1
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        return random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，关闭 Nagle 以免与延迟 ACK 叠加出 40ms 毛刺
+    disable_nagle_algorithm = True
+    server: "FakeDirectusServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self._dispatch()
+
+    def do_POST(self) -> None:
+        self._dispatch()
+
+    def do_PATCH(self) -> None:
+        self._dispatch()
+
+    def do_DELETE(self) -> None:
+        self._dispatch()
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return json.loads(raw) if raw else None
+
+    def _reply(self, status: int, payload: Any = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str) -> None:
+        self._reply(status, {"errors": [{"message": message, "extensions": {"code": code}}]})
+
+    def _dispatch(self) -> None:
+        body = self._body()
+        directus = self.server.directus
+
+        if directus.inject():
+            self._error(503, "SERVICE_UNAVAILABLE", "injected failure")
+            return
+
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if len(parts) < 2 or parts[0] != "items":
+            self._error(404, "ROUTE_NOT_FOUND", f"Route {url.path} doesn't exist.")
+            return
+
+        collection = parts[1]
+        item_id = parts[2] if len(parts) > 2 else None
+        params = parse_qsl(url.query, keep_blank_values=True)
+
+        with directus._lock:
+            handler = getattr(self, f"_{self.command.lower()}")
+            handler(directus, collection, item_id, params, body)
+
+    def _get(self, directus: FakeDirectus, collection: str, item_id: Optional[str], params, body) -> None:
+        store = directus.collections.get(collection, {})
+        if item_id is not None:
+            item = store.get(item_id)
+            if item is None:
+                self._error(403, "FORBIDDEN", "You don't have permission to access this.")
+                return
+            self._reply(200, {"data": project(item, dict(params).get("fields"))})
+            return
+        self._reply(200, {"data": apply_query(list(store.values()), params)})
+
+    def _post(self, directus: FakeDirectus, collection: str, item_id: Optional[str], params, body) -> None:
+        rows = body if isinstance(body, list) else [body or {}]
+        try:
+            created = [directus.insert(collection, row) for row in rows]
+        except KeyError:
+            self._error(400, "RECORD_NOT_UNIQUE", 'Value for field "id" has to be unique.')
+            return
+        self._reply(200, {"data": created if isinstance(body, list) else created[0]})
+
+    def _patch(self, directus: FakeDirectus, collection: str, item_id: Optional[str], params, body) -> None:
+        store = directus.collections.get(collection, {})
+
+        if item_id is not None:
+            updates = [(item_id, body or {})]
+        elif isinstance(body, list):
+            updates = [(str(row["id"]), {k: v for k, v in row.items() if k != "id"}) for row in body]
+        elif "keys" in body:
+            updates = [(str(key), body["data"]) for key in body["keys"]]
+        else:
+            rule = (body.get("query") or {}).get("filter")
+            updates = [(key, body["data"]) for key, item in store.items() if matches(item, rule)]
+
+        if any(key not in store for key, _ in updates):
+            self._error(403, "FORBIDDEN", "You don't have permission to access this.")
+            return
+
+        updated = [directus.update(collection, key, data) for key, data in updates]
+        self._reply(200, {"data": updated[0] if item_id is not None else updated})
+
+    def _delete(self, directus: FakeDirectus, collection: str, item_id: Optional[str], params, body) -> None:
+        store = directus.collections.get(collection, {})
+        keys = [item_id] if item_id is not None else [str(key) for key in (body or [])]
+        for key in keys:
+            store.pop(key, None)
+        self._reply(204)
+
+
+class FakeDirectusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], directus: FakeDirectus):
+        super().__init__(address, _Handler)
+        self.directus = directus
+
+
+def start_fake_directus(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency_ms: float = 0,
+    jitter_ms: float = 0,
+    error_rate: float = 0.0,
+    seed: bool = True
+) -> FakeDirectusServer:
+    """在后台线程启动替身服务（port=0 自动分配），返回 server，url 见 server.url"""
+    directus = FakeDirectus(latency_ms, jitter_ms, error_rate)
+    if seed:
+        directus.seed("suppliers", DEMO_SUPPLIERS)
+
+    server = FakeDirectusServer((host, port), directus)
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地 Directus 替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8055)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的平均注入延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟抖动（±）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率 (0-1)")
+    args = parser.parse_args()
+
+    directus = FakeDirectus(args.latency_ms, args.jitter_ms, args.error_rate)
+    directus.seed("suppliers", DEMO_SUPPLIERS)
+
+    server = FakeDirectusServer((args.host, args.port), directus)
+    print(f"🧪 Fake Directus 已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
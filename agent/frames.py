@@ -0,0 +1,408 @@
+"""
+Frames - 视频关键帧提取
+yt-dlp 解析出媒体地址后，边下载边把字节流写入命名管道，由 OpenCV (FFmpeg)
+直接解码，不落地完整视频文件；按固定频率采样并用直方图场景切换打分挑选关键帧。
+送入视觉模型前再用感知哈希 (pHash) 去掉近似重复的帧。
+
+提取在独立进程池中执行，避免阻塞 bot 的事件循环。
+"""
+
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, List, Tuple
+
+import cv2
+import numpy as np
+
+FRAME_WORKERS = int(os.getenv("FRAME_WORKERS", "2"))
+FRAME_BUDGET_SECONDS = float(os.getenv("FRAME_BUDGET_SECONDS", "20"))
+FRAME_SAMPLE_FPS = float(os.getenv("FRAME_SAMPLE_FPS", "1"))
+FRAME_MAX_SIDE = int(os.getenv("FRAME_MAX_SIDE", "768"))
+FRAME_MAX_SAMPLES = int(os.getenv("FRAME_MAX_SAMPLES", "90"))
+FRAME_CANDIDATES = int(os.getenv("FRAME_CANDIDATES", "8"))
+FRAME_DEDUP_THRESHOLD = int(os.getenv("FRAME_DEDUP_THRESHOLD", "10"))
+
+# HSV 直方图维度（H x S）
+_HIST_BINS = [16, 8]
+_HIST_RANGES = [0, 180, 0, 256]
+_CHUNK_SIZE = 64 * 1024
+
+# pHash：32x32 灰度图做二维 DCT，取左上 8x8 低频系数
+_PHASH_SIZE = 32
+_PHASH_LOW = 8
+
+_executor: Optional[ProcessPoolExecutor] = None
+# 提交到进程池的任务数不超过工作进程数：排队发生在这里，不计入单个视频的时间预算
+_slots: Optional[asyncio.Semaphore] = None
+
+
+# ==================== 下载 -> 解码 ====================
+
+def _resolve_media(url: str):
+    """用 yt-dlp 解析直链，返回 (ydl, 媒体 URL, 请求头)；调用方负责关闭 ydl"""
+    import yt_dlp
+
+    ydl = yt_dlp.YoutubeDL({
+        "quiet": True,
+        "no_warnings": True,
+        "noplaylist": True,
+        "format": "best[ext=mp4][vcodec!=none]/best[vcodec!=none]/best",
+    })
+    info = ydl.extract_info(url, download=False)
+    return ydl, info["url"], info.get("http_headers") or {}
+
+
+def _pump(ydl, media_url: str, headers: dict, fifo_path: str, deadline: float, stop: threading.Event) -> None:
+    """后台线程：把下载字节流写进命名管道"""
+    from yt_dlp.networking import Request
+
+    try:
+        fd = os.open(fifo_path, os.O_WRONLY)
+    except OSError:
+        return
+
+    response = None
+    try:
+        response = ydl.urlopen(Request(media_url, headers=headers))
+        while not stop.is_set() and time.monotonic() < deadline:
+            chunk = response.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            os.write(fd, chunk)
+    except (BrokenPipeError, OSError):
+        # 解码端已关闭（采样完成或超出预算）
+        pass
+    finally:
+        if response is not None:
+            response.close()
+        os.close(fd)
+
+
+def _downscale(frame: np.ndarray, max_side: int) -> np.ndarray:
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return frame
+    return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _sample_frames(
+    capture: cv2.VideoCapture,
+    deadline: float,
+    sample_fps: float,
+    max_side: int,
+    max_samples: int
+) -> List[np.ndarray]:
+    """顺序解码，按 sample_fps 采样；只对被采样的帧做完整解码（retrieve）"""
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    step = max(1, int(round(fps / sample_fps)))
+
+    samples: List[np.ndarray] = []
+    index = 0
+    while len(samples) < max_samples and time.monotonic() < deadline:
+        if not capture.grab():
+            break
+        if index % step == 0:
+            ok, frame = capture.retrieve()
+            if ok:
+                samples.append(_downscale(frame, max_side))
+        index += 1
+    return samples
+
+
+def _open_pipe(ydl, media_url: str, headers: dict, deadline: float) -> Tuple[cv2.VideoCapture, Callable[[], None]]:
+    """下载线程写命名管道、OpenCV 读管道解码，返回 (capture, cleanup)"""
+    workdir = tempfile.mkdtemp(prefix="tiktok_frames_")
+    fifo_path = os.path.join(workdir, "stream")
+    os.mkfifo(fifo_path)
+    
+    stop = threading.Event()
+    pump = threading.Thread(
+        target=_pump, args=(ydl, media_url, headers, fifo_path, deadline, stop), daemon=True
+    )
+    pump.start()
+    capture = cv2.VideoCapture(fifo_path, cv2.CAP_FFMPEG)
+    
+    def cleanup():
+        stop.set()
+        opened = capture.isOpened()
+        capture.release()
+        if not opened:
+            # 解码端未能打开管道时写线程可能仍阻塞在 open 上，这里打开读端放行
+            try:
+                os.close(os.open(fifo_path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        pump.join(timeout=5)
+        os.unlink(fifo_path)
+        os.rmdir(workdir)
+    
+    return capture, cleanup
+
+
+def _open_direct(media_url: str) -> Tuple[cv2.VideoCapture, Callable[[], None]]:
+    """由 FFmpeg 直接按 HTTP Range 流式拉取（无法携带 cookie / 自定义请求头）"""
+    capture = cv2.VideoCapture(media_url, cv2.CAP_FFMPEG)
+    return capture, capture.release
+
+
+def _open_download(ydl, media_url: str, headers: dict, deadline: float) -> Tuple[cv2.VideoCapture, Callable[[], None]]:
+    """完整下载到临时文件后解码（可 seek，带 yt-dlp 的请求头 / cookie；最后的兜底）"""
+    from yt_dlp.networking import Request
+
+    workdir = tempfile.mkdtemp(prefix="tiktok_frames_")
+    path = os.path.join(workdir, "video.mp4")
+
+    def remove():
+        if os.path.exists(path):
+            os.unlink(path)
+        os.rmdir(workdir)
+
+    try:
+        with open(path, "wb") as f:
+            response = ydl.urlopen(Request(media_url, headers=headers))
+            try:
+                while time.monotonic() < deadline:
+                    chunk = response.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            finally:
+                response.close()
+    except Exception:
+        remove()
+        raise
+    capture = cv2.VideoCapture(path, cv2.CAP_FFMPEG)
+
+    def cleanup():
+        capture.release()
+        remove()
+
+    return capture, cleanup
+
+
+# ==================== 场景切换打分 ====================
+
+def scene_change_scores(frames: List[np.ndarray]) -> np.ndarray:
+    """
+    每帧与前一帧的 HSV 直方图差异（总变差距离，0~1），首帧记为 1
+
+    直方图计算逐帧完成，距离计算整体向量化
+    """
+    hists = np.stack([
+        cv2.calcHist([cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)], [0, 1], None, _HIST_BINS, _HIST_RANGES).ravel()
+        for frame in frames
+    ]).astype(np.float32)
+    hists /= np.maximum(hists.sum(axis=1, keepdims=True), 1.0)
+
+    scores = np.ones(len(frames), dtype=np.float32)
+    scores[1:] = 0.5 * np.abs(np.diff(hists, axis=0)).sum(axis=1)
+    return scores
+
+
+def select_key_frames(frames: List[np.ndarray], num_frames: int) -> List[np.ndarray]:
+    """按场景切换得分挑选关键帧（相邻入选帧至少间隔一个采样点），保持时间顺序"""
+    if len(frames) <= num_frames:
+        return frames
+
+    scores = scene_change_scores(frames)
+    chosen: List[int] = []
+    for index in np.argsort(-scores, kind="stable"):
+        if all(abs(int(index) - other) > 1 for other in chosen):
+            chosen.append(int(index))
+        if len(chosen) == num_frames:
+            break
+
+    # 场景太少时用均匀采样补齐
+    if len(chosen) < num_frames:
+        for index in np.linspace(0, len(frames) - 1, num_frames).astype(int):
+            if int(index) not in chosen:
+                chosen.append(int(index))
+            if len(chosen) == num_frames:
+                break
+
+    return [frames[i] for i in sorted(chosen)]
+
+
+# ==================== 感知哈希去重 ====================
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """正交 DCT-II 矩阵：D @ x 即 x 的一维 DCT"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+
+
+def phash(frames: List[np.ndarray]) -> np.ndarray:
+    """批量计算 64 位 pHash，返回 (帧数, 64) 的布尔数组"""
+    if not frames:
+        return np.zeros((0, _PHASH_LOW * _PHASH_LOW), dtype=bool)
+
+    small = np.stack([
+        cv2.resize(
+            cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+            (_PHASH_SIZE, _PHASH_SIZE),
+            interpolation=cv2.INTER_AREA
+        )
+        for frame in frames
+    ]).astype(np.float32)
+
+    # 二维 DCT：D @ X @ D^T，对整批一次完成
+    coeffs = _DCT @ small @ _DCT.T
+    low = coeffs[:, :_PHASH_LOW, :_PHASH_LOW].reshape(len(frames), -1)
+    # 中位数不含直流分量，避免整体亮度主导
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return low > median
+
+
+def hamming_matrix(hashes: np.ndarray) -> np.ndarray:
+    """两两汉明距离矩阵"""
+    return (hashes[:, None, :] != hashes[None, :, :]).sum(axis=2)
+
+
+def dedup_frames(
+    frames: List[np.ndarray],
+    max_frames: int,
+    threshold: int = FRAME_DEDUP_THRESHOLD
+) -> Tuple[List[np.ndarray], Dict[str, Any]]:
+    """
+    去掉近似重复帧并保留差异最大的 max_frames 帧（保持时间顺序）
+
+    1. 按时间顺序扫描，与已保留帧的汉明距离均 <= threshold 的帧视为重复
+    2. 剩余帧超过 max_frames 时做最远点采样：每次加入与已选集合最小距离最大的帧
+
+    Returns:
+        (保留的帧, {"candidates", "unique", "kept", "dedup_ratio"})
+    """
+    stats: Dict[str, Any] = {"candidates": len(frames), "unique": 0, "kept": 0, "dedup_ratio": 0.0}
+    if not frames:
+        return [], stats
+
+    distances = hamming_matrix(phash(frames))
+
+    unique: List[int] = []
+    for index in range(len(frames)):
+        if all(distances[index, other] > threshold for other in unique):
+            unique.append(index)
+
+    chosen = unique
+    if len(unique) > max_frames:
+        sub = distances[np.ix_(unique, unique)]
+        # 从与其他帧平均距离最大的帧开始
+        picked = [int(np.argmax(sub.mean(axis=1)))]
+        nearest = sub[picked[0]].astype(np.float32)
+        while len(picked) < max_frames:
+            nearest[picked] = -1
+            candidate = int(np.argmax(nearest))
+            picked.append(candidate)
+            nearest = np.minimum(nearest, sub[candidate])
+        chosen = sorted(unique[i] for i in picked)
+
+    stats["unique"] = len(unique)
+    stats["kept"] = len(chosen)
+    stats["dedup_ratio"] = round(1 - len(unique) / len(frames), 3)
+    return [frames[i] for i in chosen], stats
+
+
+# ==================== 入口 ====================
+
+def extract_key_frames(
+    url: str,
+    num_frames: int = 3,
+    budget_seconds: float = FRAME_BUDGET_SECONDS,
+    sample_fps: float = FRAME_SAMPLE_FPS,
+    max_side: int = FRAME_MAX_SIDE,
+    max_samples: int = FRAME_MAX_SAMPLES
+) -> List[np.ndarray]:
+    """
+    同步提取关键帧（在工作进程中执行），返回 BGR 图像数组列表
+
+    超出 budget_seconds 时停止下载与解码，用已采样的帧挑选
+    """
+    deadline = time.monotonic() + budget_seconds
+    ydl, media_url, headers = _resolve_media(url)
+    
+    # 依次尝试：管道边下边解 -> FFmpeg 直连 -> 下载到临时文件。
+    # moov 在文件尾的 MP4 从管道能"打开"但解不出帧（需要 seek），因此以采样结果判断是否回退
+    openers: List[Callable[[], Tuple[cv2.VideoCapture, Callable[[], None]]]] = []
+    if hasattr(os, "mkfifo"):
+        openers.append(lambda: _open_pipe(ydl, media_url, headers, deadline))
+    openers.append(lambda: _open_direct(media_url))
+    openers.append(lambda: _open_download(ydl, media_url, headers, deadline))
+    
+    samples: List[np.ndarray] = []
+    try:
+        for opener in openers:
+            if time.monotonic() >= deadline:
+                break
+            try:
+                capture, cleanup = opener()
+            except Exception as e:
+                print(f"⚠️ 打开视频流失败: {e}")
+                continue
+            try:
+                if capture.isOpened():
+                    samples = _sample_frames(capture, deadline, sample_fps, max_side, max_samples)
+            finally:
+                cleanup()
+            if samples:
+                break
+    finally:
+        ydl.close()
+
+    return select_key_frames(samples, num_frames)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        # spawn：避免在已有线程 / 事件循环的进程里 fork
+        _executor = ProcessPoolExecutor(
+            max_workers=FRAME_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def extract_key_frames_async(
+    url: str,
+    num_frames: int = 3,
+    budget_seconds: float = FRAME_BUDGET_SECONDS
+) -> List[np.ndarray]:
+    """
+    在进程池中提取关键帧；超过预算（含进程调度余量）返回空列表
+
+    先等到空闲的工作进程再提交并开始计时，排队等待不占用该视频的预算
+    """
+    global _slots
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(FRAME_WORKERS)
+
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_get_executor(), extract_key_frames, url, num_frames, budget_seconds)
+        try:
+            return await asyncio.wait_for(future, timeout=budget_seconds + 10)
+        except asyncio.TimeoutError:
+            print(f"⏱️ 关键帧提取超出预算: {url}")
+            return []
+
+
+def shutdown_frame_workers() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,78 @@
+"""
+Import Report - 模块导入耗时报告
+在子进程中以 python -X importtime 导入目标模块，汇总总耗时、最慢的顶层包，
+并检查重型依赖（OpenCV / NumPy / OpenAI SDK）是否被提前加载
+
+用法:
+    # Bot 启动路径（需安装 discord.py）
+    python import_report.py bot
+
+    # 只看分析模块，列出前 20 个包
+    python import_report.py tiktok_hunter --top 20
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+# 应在首次分析时才加载的依赖
+HEAVY_MODULES = ("cv2", "numpy", "openai")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 输出，返回 [(模块名, 自身 us, 累计 us, 嵌套层级)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(module: str) -> Tuple[List[Tuple[str, int, int, int]], str]:
+    agent_dir = os.path.dirname(os.path.abspath(__file__))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=agent_dir, capture_output=True, text=True
+    )
+    rows = parse_importtime(completed.stderr)
+    errors = "\n".join(line for line in completed.stderr.splitlines() if not line.startswith("import time:"))
+    return rows, errors if completed.returncode else ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="模块导入耗时报告")
+    parser.add_argument("module", nargs="?", default="bot", help="要导入的模块（默认 bot）")
+    parser.add_argument("--top", type=int, default=15, help="列出最慢的顶层包数量")
+    args = parser.parse_args()
+
+    rows, errors = measure(args.module)
+    if errors:
+        print(f"❌ 导入 {args.module} 失败:\n{errors}")
+        sys.exit(1)
+
+    # 按顶层包聚合自身耗时（同一个包的子模块分散在不同的导入链上）
+    packages: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        top = name.split(".")[0]
+        packages[top] = packages.get(top, 0) + self_us
+    total = sum(packages.values())
+
+    print(f"\n📦 import {args.module}: {total / 1000:.1f} ms, {len(rows)} 个模块")
+    print(f"{'package':<28}{'self ms':>10}{'share':>8}")
+    for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<28}{self_us / 1000:>10.1f}{self_us / total:>8.0%}")
+
+    loaded = [name for name in HEAVY_MODULES if name in packages]
+    if loaded:
+        print(f"\n⚠️ 启动路径上加载了重型依赖: {', '.join(loaded)}")
+    else:
+        print(f"\n✅ 启动路径未加载 {', '.join(HEAVY_MODULES)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+JSON Stream - 流式输出的增量 JSON 解析
+模型逐 token 输出 JSON 对象时，每当一个顶层字段完整到达就立即解析并回调，
+无需等待整个响应结束。对象前后的说明文字 / ```json 代码块标记会被忽略。
+"""
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+
+class IncrementalJsonObject:
+    """
+    增量解析单个顶层 JSON 对象
+
+    逐字符扫描（每个字符只扫描一次），跟踪字符串 / 转义 / 嵌套深度；
+    在深度 1 遇到 "," 或 "}" 时，切出刚结束的 "key": value 片段单独解析
+    """
+
+    def __init__(self, on_field: Optional[Callable[[str, Any], None]] = None):
+        self.on_field = on_field
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start: Optional[int] = None
+
+    def feed(self, text: str) -> None:
+        if self.complete or not text:
+            return
+        self._buffer += text
+
+        buffer = self._buffer
+        for pos in range(self._pos, len(buffer)):
+            char = buffer[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                # 跳过对象之前的内容
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = pos + 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_member(pos)
+                    self.complete = True
+                    self._pos = pos + 1
+                    return
+            elif char == "," and self._depth == 1:
+                self._finish_member(pos)
+                self._member_start = pos + 1
+
+        self._pos = len(buffer)
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """对象完整结束时返回全部字段，否则返回 None"""
+        return dict(self.fields) if self.complete else None
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def _finish_member(self, end: int) -> None:
+        member = self._buffer[self._member_start:end].strip()
+        if not member:
+            return
+        try:
+            parsed = json.loads("{" + member + "}")
+        except json.JSONDecodeError:
+            # 单个字段不合法时跳过，由调用方在结束后整体兜底解析
+            return
+        for key, value in parsed.items():
+            self.fields[key] = value
+            if self.on_field is not None:
+                self.on_field(key, value)
@@ -0,0 +1,148 @@
+"""
+Load Test - directus_client 压测驱动
+按目标 QPS 开环发起 create_sourcing_request / search_factory_match / 历史查询，
+统计吞吐量与 p50 / p95 / p99 延迟
+
+用法:
+    # 自动启动本地 Directus 替身，注入 20ms±10ms 延迟与 1% 错误
+    python load_test.py --qps 100 --duration 30 --spawn-fake --latency-ms 20 --jitter-ms 10 --error-rate 0.01
+
+    # 对已有的 Directus（如 fake_directus.py 或测试环境）压测
+    python load_test.py --url http://127.0.0.1:8055 --qps 50 --mix create=1,search=3,history=2
+"""
+
+import os
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Tuple
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    # 环境变量需在导入 directus_client 之前设置
+    import directus_client as dc
+
+    operations = {
+        "create": lambda i: dc.create_sourcing_request({
+            "platform": "LoadTest",
+            "user_id": f"user-{i % 50}",
+            "user_name": "loadtest",
+            "video_url": f"https://www.tiktok.com/@load/video/{i}",
+            "product_name": "Load Test Product",
+            "visual_analysis": {"category": "Home Appliances", "confidence": 0.9},
+            "status": "quoted",
+            "quote_price_usd": 4.2
+        }),
+        "search": lambda i: dc.search_factory_match(
+            "Anti-Gravity Humidifier",
+            random.choice(["家居用品", "消费电子", "Home Appliances", "工业材料"])
+        ),
+        "history": lambda i: dc.get_user_sourcing_history(f"user-{i % 50}", limit=10),
+    }
+
+    mix = parse_mix(args.mix)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+
+    await dc.init_directus()
+    if not args.no_supplier_index:
+        # 等待供应商快照加载完成，避免把冷启动计入延迟
+        for _ in range(50):
+            if dc.supplier_index.ready:
+                break
+            await asyncio.sleep(0.1)
+
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+
+    async def one(name: str, i: int) -> None:
+        started = time.perf_counter()
+        result = await operations[name](i)
+        latencies[name].append(time.perf_counter() - started)
+        if result is None:
+            errors[name] += 1
+
+    # 开环：按固定间隔发起请求，不等待上一个完成
+    interval = 1.0 / args.qps
+    total = int(args.qps * args.duration)
+    tasks = []
+    started = time.perf_counter()
+
+    for i in range(total):
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = random.choices(names, weights)[0]
+        tasks.append(asyncio.create_task(one(name, i)))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await dc.close_directus()
+
+    all_samples = [s for samples in latencies.values() for s in samples]
+    print(f"\n📊 {len(all_samples)} 请求 / {elapsed:.1f}s = {len(all_samples) / elapsed:.1f} req/s "
+          f"(目标 {args.qps} QPS)")
+    print(f"{'operation':<10}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in names + ["all"]:
+        samples = all_samples if name == "all" else latencies[name]
+        error_count = sum(errors.values()) if name == "all" else errors[name]
+        print(
+            f"{name:<10}{len(samples):>8}{error_count:>8}"
+            f"{percentile(samples, 0.50) * 1000:>10.2f}"
+            f"{percentile(samples, 0.95) * 1000:>10.2f}"
+            f"{percentile(samples, 0.99) * 1000:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="directus_client 压测")
+    parser.add_argument("--url", help="Directus 地址（默认读取 DIRECTUS_URL）")
+    parser.add_argument("--qps", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=10, help="秒")
+    parser.add_argument("--mix", default="create=1,search=3,history=2", help="操作权重")
+    parser.add_argument("--spawn-fake", action="store_true", help="启动本地 Directus 替身")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-outbox", action="store_true", help="create 直接写 Directus，不经过本地 outbox")
+    parser.add_argument("--no-supplier-index", action="store_true", help="search 不使用本地供应商索引")
+    args = parser.parse_args()
+
+    if args.spawn_fake:
+        from fake_directus import start_fake_directus
+        server = start_fake_directus(
+            latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate
+        )
+        os.environ["DIRECTUS_URL"] = server.url
+        os.environ.setdefault("DIRECTUS_TOKEN", "loadtest")
+        os.environ.setdefault("OUTBOX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.loadtest.db"))
+        print(f"🧪 Fake Directus: {server.url}")
+    elif args.url:
+        os.environ["DIRECTUS_URL"] = args.url
+
+    if args.no_outbox:
+        os.environ["OUTBOX_ENABLED"] = "false"
+    if args.no_supplier_index:
+        os.environ["SUPPLIER_SYNC_ENABLED"] = "false"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Metrics - 进程内指标与 Prometheus /metrics 端点
+无第三方依赖：计数器 / 仪表 / 直方图，按 Prometheus 文本格式输出
+"""
+
+import os
+import asyncio
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """仪表；传入 callback 时在采集时计算（返回 {标签值元组: 数值}）"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], Dict[LabelValues, float]]] = None
+    ):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def _samples(self) -> List[str]:
+        values = self._callback() if self._callback else self._values
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            for labels, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各桶计数..., 总次数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += 1
+        state[-1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, state in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, inf)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {state[-2]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+# 进程级指标注册表
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    """按 Prometheus 文本格式输出所有指标"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ==================== /metrics 端点 ====================
+
+_server: Optional[asyncio.AbstractServer] = None
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await reader.readline()
+        # 读完请求头
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+    """在本地启动 /metrics 端点（幂等；port=0 表示关闭）"""
+    global _server
+
+    if _server is not None or not port:
+        return
+
+    _server = await asyncio.start_server(_handle, host, port)
+    print(f"📈 Metrics 已启动: http://{host}:{port}/metrics")
+
+
+async def stop_metrics_server() -> None:
+    global _server
+
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,263 @@
+"""
+OpenAI Limiter - 进程级 OpenAI 调用限流
+- 并发上限按 AIMD 自适应：成功时加性增长，429 时减半并暂停到限额重置
+- 请求数 / token 双令牌桶，速率与余量随响应头 x-ratelimit-* 校准
+- 交互请求（Discord 用户）优先于后台任务
+- 排队等待时间以 openai_queue_wait_seconds 直方图暴露
+"""
+
+import os
+import re
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+from metrics import Counter, Gauge, Histogram
+
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "30000"))
+OPENAI_CONCURRENCY_INITIAL = float(os.getenv("OPENAI_CONCURRENCY_INITIAL", "4"))
+OPENAI_CONCURRENCY_MIN = float(os.getenv("OPENAI_CONCURRENCY_MIN", "1"))
+OPENAI_CONCURRENCY_MAX = float(os.getenv("OPENAI_CONCURRENCY_MAX", "32"))
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# 图像 token 粗估（low detail 固定 85；high 按 768x768 左右的典型帧估算）
+_IMAGE_TOKENS = {"low": 85, "high": 765}
+
+OPENAI_QUEUE_WAIT = Histogram(
+    "openai_queue_wait_seconds", "OpenAI 调用在限流器中的排队时间", ("priority",)
+)
+OPENAI_RATE_LIMITED = Counter("openai_rate_limited_total", "OpenAI 429 次数")
+
+
+class TokenBucket:
+    """令牌桶：capacity 为每分钟限额，按 capacity / 60 每秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """拿到 amount 个令牌还需等待的秒数（单次请求超过容量时按容量计）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """用服务端的限额 / 余量校准（余量只下调，避免覆盖本地已预扣的令牌）"""
+        self._refill()
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.tokens = min(self.tokens, remaining)
+
+
+def parse_reset(value: Optional[str]) -> float:
+    """解析 x-ratelimit-reset-* 的时长格式，如 "1s"、"6m0s"、"250ms" """
+    if not value:
+        return 0.0
+    total = 0.0
+    for number, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        total += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """请求 token 粗估：文本按 2 字符 / token，图像按 detail 档位，加上最大输出"""
+    total = max_tokens
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                total += _IMAGE_TOKENS.get(part["image_url"].get("detail", "high"), 765)
+            else:
+                total += len(part.get("text", "")) // 2
+    return total
+
+
+class Permit:
+    """一次调用的许可；调用方用响应头 / 实际用量回报结果"""
+
+    def __init__(self, limiter: "AdaptiveLimiter", tokens: int):
+        self._limiter = limiter
+        self.tokens = tokens
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        self._limiter.observe_headers(headers)
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        """按实际用量退还多扣的 token"""
+        if actual_tokens is not None and actual_tokens < self.tokens:
+            self._limiter.token_bucket.refund(self.tokens - actual_tokens)
+            self.tokens = actual_tokens
+
+
+class AdaptiveLimiter:
+    """按优先级排队的自适应并发 + 双令牌桶限流器（单事件循环内使用）"""
+
+    def __init__(
+        self,
+        rpm: float = OPENAI_RPM,
+        tpm: float = OPENAI_TPM,
+        initial: float = OPENAI_CONCURRENCY_INITIAL,
+        minimum: float = OPENAI_CONCURRENCY_MIN,
+        maximum: float = OPENAI_CONCURRENCY_MAX
+    ):
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.inflight = 0
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, future in self._waiters if not future.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive", tokens: int = 1000) -> AsyncIterator[Permit]:
+        """
+        排队获取一次调用许可
+
+        调用中抛出 openai.RateLimitError 时自动减半并发并暂停；其他成功返回时加性增长
+        """
+        await self._acquire(PRIORITIES.get(priority, 1), priority, tokens)
+        permit = Permit(self, tokens)
+        try:
+            yield permit
+        except Exception as e:
+            if getattr(e, "status_code", None) == 429:
+                response = getattr(e, "response", None)
+                self.on_rate_limited(response.headers if response is not None else {})
+            raise
+        else:
+            self.on_success()
+        finally:
+            self.inflight -= 1
+            self._dispatch()
+
+    # ==================== AIMD ====================
+
+    def on_success(self) -> None:
+        # 每个"窗口"（约 limit 次成功）并发 +1
+        self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_rate_limited(self, headers: Mapping[str, str]) -> None:
+        OPENAI_RATE_LIMITED.inc()
+        self.limit = max(self.minimum, self.limit / 2)
+        reset = max(
+            parse_reset(headers.get("x-ratelimit-reset-requests")),
+            parse_reset(headers.get("x-ratelimit-reset-tokens")),
+            _header_float(headers, "retry-after") or 0.0,
+            1.0
+        )
+        self._paused_until = max(self._paused_until, time.monotonic() + reset)
+        print(f"🚦 OpenAI 限流 (429)：并发降至 {self.limit:.1f}，暂停 {reset:.1f}s")
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        self.request_bucket.sync(
+            _header_float(headers, "x-ratelimit-limit-requests"),
+            _header_float(headers, "x-ratelimit-remaining-requests")
+        )
+        self.token_bucket.sync(
+            _header_float(headers, "x-ratelimit-limit-tokens"),
+            _header_float(headers, "x-ratelimit-remaining-tokens")
+        )
+
+    # ==================== 排队与调度 ====================
+
+    async def _acquire(self, rank: int, priority: str, tokens: int) -> None:
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (rank, next(self._sequence), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配许可但调用方被取消：归还
+                self.inflight -= 1
+                self._dispatch()
+            raise
+        finally:
+            OPENAI_QUEUE_WAIT.observe(priority, value=time.monotonic() - started)
+
+    def _dispatch(self) -> None:
+        """按优先级依次放行；受并发、暂停或令牌不足阻塞时定时重试"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters:
+            rank, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.inflight >= max(1, int(self.limit)):
+                return
+
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.request_bucket.wait_time(1),
+                self.token_bucket.wait_time(tokens)
+            )
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            self.request_bucket.take(1)
+            self.token_bucket.take(tokens)
+            self.inflight += 1
+            future.set_result(None)
+
+
+openai_limiter = AdaptiveLimiter()
+
+Gauge(
+    "openai_concurrency_limit", "OpenAI 自适应并发上限",
+    callback=lambda: {(): round(openai_limiter.limit, 2)}
+)
+Gauge(
+    "openai_inflight_requests", "在途 OpenAI 请求数",
+    callback=lambda: {(): openai_limiter.inflight}
+)
+Gauge(
+    "openai_queued_requests", "在限流器中排队的 OpenAI 请求数",
+    callback=lambda: {(): openai_limiter.queued}
+)
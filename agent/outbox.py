@@ -0,0 +1,122 @@
+"""
+Outbox - 本地持久化写入队列
+Directus 写入先落到本地 SQLite（WAL 模式），再由后台任务按顺序回放，
+Directus 宕机时记录不会丢失，用户侧也无需等待远程写入
+"""
+
+import json
+import time
+import sqlite3
+from typing import Optional, List, Dict, Any
+
+
+class Outbox:
+    """基于 SQLite WAL 的顺序写入队列（单进程使用）"""
+
+    PENDING = "pending"
+    DEAD = "dead"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                method TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                item_id TEXT,
+                payload TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_item ON outbox (item_id, status)"
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def enqueue(self, method: str, endpoint: str, payload: Any, item_id: Optional[str] = None) -> int:
+        """追加一条待回放写入，返回序号"""
+        cursor = self._conn.execute(
+            "INSERT INTO outbox (method, endpoint, item_id, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (method, endpoint, item_id, json.dumps(payload, ensure_ascii=False), time.time())
+        )
+        return cursor.lastrowid
+
+    def head(self) -> Optional[Dict[str, Any]]:
+        """返回最早一条待回放记录"""
+        row = self._conn.execute(
+            "SELECT * FROM outbox WHERE status = ? ORDER BY seq LIMIT 1", (self.PENDING,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry["payload"] = json.loads(entry["payload"]) if entry["payload"] else None
+        return entry
+
+    def ack(self, seq: int) -> None:
+        """回放成功，删除记录"""
+        self._conn.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+
+    def mark_failed(self, seq: int, error: str, max_attempts: int) -> bool:
+        """记录一次失败；超过最大次数转入死信并返回 True"""
+        self._conn.execute(
+            "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+            (error, seq)
+        )
+        cursor = self._conn.execute(
+            "UPDATE outbox SET status = ? WHERE seq = ? AND attempts >= ?",
+            (self.DEAD, seq, max_attempts)
+        )
+        return cursor.rowcount > 0
+
+    def mark_dead(self, seq: int, error: str) -> None:
+        """不可重试的失败：立即转入死信"""
+        self._conn.execute(
+            "UPDATE outbox SET attempts = attempts + 1, last_error = ?, status = ? WHERE seq = ?",
+            (error, self.DEAD, seq)
+        )
+
+    def pending_count(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM outbox WHERE status = ?", (self.PENDING,)
+        ).fetchone()[0]
+
+    def is_pending(self, item_id: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM outbox WHERE item_id = ? AND status = ? LIMIT 1",
+            (item_id, self.PENDING)
+        ).fetchone()
+        return row is not None
+
+    def pending_item(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按写入顺序合并某条记录尚未回放的 POST / PATCH，得到其本地视图
+
+        创建请求已回放（仅剩 PATCH）时返回 None，应以 Directus 为准
+        """
+        rows = self._conn.execute(
+            "SELECT method, payload FROM outbox WHERE item_id = ? AND status = ? ORDER BY seq",
+            (item_id, self.PENDING)
+        ).fetchall()
+        if not rows or rows[0]["method"] != "POST":
+            return None
+
+        item: Dict[str, Any] = {}
+        for row in rows:
+            item.update(json.loads(row["payload"]) or {})
+        item["id"] = item_id
+        return item
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT * FROM outbox WHERE status = ? ORDER BY seq", (self.DEAD,)
+        ).fetchall()
+        return [dict(row) for row in rows]
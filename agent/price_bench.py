@@ -0,0 +1,72 @@
+"""
+Price Bench - PriceCalculator 标量 / 批量报价微基准
+随机生成 品类 × 复杂度 × 起订量 组合，对比逐个调用 estimate_fob_price 与一次
+estimate_fob_prices 的耗时，并校验两条路径的结果一致
+
+用法:
+    python price_bench.py --rows 1000,10000,100000 --repeat 5
+"""
+
+import time
+import random
+import argparse
+from typing import Callable, List, Tuple
+
+
+def best_of(repeat: int, fn: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def make_rows(count: int, seed: int) -> Tuple[List[str], List[str], List[int]]:
+    from tiktok_hunter import PriceCalculator
+
+    rng = random.Random(seed)
+    categories = list(PriceCalculator.CATEGORY_COEFFICIENTS) + ["Toys"]
+    complexities = list(PriceCalculator.BASE_PRICES)
+    return (
+        [rng.choice(categories) for _ in range(count)],
+        [rng.choice(complexities) for _ in range(count)],
+        [rng.choice([100, 500, 1000, 2000, 3000, 5000, 10000]) for _ in range(count)]
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="PriceCalculator 标量 / 批量报价微基准")
+    parser.add_argument("--rows", default="1000,10000,100000", help="逗号分隔的组合数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项取最快的一次")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from tiktok_hunter import PriceCalculator
+
+    print(f"\n{'rows':>8}{'scalar ms':>12}{'batch ms':>12}{'speedup':>10}{'match':>8}")
+    for count in [int(rows) for rows in args.rows.split(",")]:
+        categories, complexities, quantities = make_rows(count, args.seed)
+
+        def scalar() -> list:
+            return [
+                PriceCalculator.estimate_fob_price(category, complexity, quantity)
+                for category, complexity, quantity in zip(categories, complexities, quantities)
+            ]
+
+        def batch() -> dict:
+            return PriceCalculator.estimate_fob_prices(categories, complexities, quantities)
+
+        scalar_time = best_of(args.repeat, scalar)
+        batch_time = best_of(args.repeat, batch)
+
+        expected = [quote["unit_price_usd"] for quote in scalar()]
+        match = expected == batch()["unit_price_usd"].tolist()
+        print(
+            f"{count:>8}{scalar_time * 1000:>12.2f}{batch_time * 1000:>12.2f}"
+            f"{scalar_time / batch_time:>9.1f}x{'✅' if match else '❌':>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Resilience - 远程调用弹性策略
+延迟统计（用于对冲请求）、熔断器与抖动退避
+"""
+
+import time
+import random
+from collections import deque
+from typing import Optional
+
+
+class LatencyTracker:
+    """滑动窗口延迟统计，用于推导对冲请求的触发延迟"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: deque = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """返回分位数；样本不足时返回 None"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed：正常放行，连续失败达到 failure_threshold 后打开
+    - open：快速失败，reset_timeout 秒后进入 half-open
+    - half-open：只放行一个探测请求，成功则关闭，失败则重新打开；
+      探测被取消时由调用方 release_probe()，超过 reset_timeout 未回报的探测也会被放弃
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+
+        # half-open：同一时间只允许一个探测请求；超过 reset_timeout 仍未回报的探测视为已丢失
+        if self._probing and time.monotonic() - self._probe_started < self.reset_timeout:
+            return False
+        self._probing = True
+        self._probe_started = time.monotonic()
+        return True
+
+    @property
+    def probing(self) -> bool:
+        return self.state == self.HALF_OPEN and self._probing
+
+    def release_probe(self) -> None:
+        """
+        探测请求未记录结果就结束（被取消 / 非网络异常）时归还探测名额
+
+        否则 half-open 会一直认为有探测在途，之后的请求全部快速失败
+        """
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 5.0) -> float:
+    """指数退避 + 全抖动（full jitter）"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,144 @@
+"""
+Supplier Index - 供应商本地索引
+在内存中保存 suppliers 集合的完整快照，并对品类/工艺/认证/地区建立倒排索引，
+使工厂匹配无需每次请求都访问 Directus
+"""
+
+import re
+from collections import defaultdict
+from typing import Optional, List, Dict, Any, Iterable, Set
+
+
+# 参与倒排索引的字段及其打分权重
+INDEXED_FIELDS = {
+    "categories": 3.0,
+    "core_processes": 2.0,
+    "certifications": 1.0,
+    "location": 1.0,
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    切分检索词：英文/数字按单词，中文按二元组（"家居用品" -> 家居/居用/用品）
+    """
+    text = (text or "").lower()
+    terms = {w for w in _WORD_RE.findall(text) if len(w) > 1}
+
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+
+    return terms
+
+
+def _field_values(record: Dict[str, Any], field: str) -> Iterable[str]:
+    value = record.get(field)
+
+    # 兼容旧版单值字段 category
+    if field == "categories" and not value:
+        value = record.get("category")
+
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value if v]
+
+
+def _change_marker(record: Dict[str, Any]) -> Optional[str]:
+    return record.get("updated_at") or record.get("created_at")
+
+
+class SupplierIndex:
+    """供应商快照 + 倒排索引（仅收录 status=active 的供应商）"""
+
+    def __init__(self):
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[str, Dict[str, Set[str]]] = {
+            field: defaultdict(set) for field in INDEXED_FIELDS
+        }
+        self.watermark: Optional[str] = None
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def load(self, records: Iterable[Dict[str, Any]]) -> None:
+        """用完整快照重建索引"""
+        self._records.clear()
+        for field in INDEXED_FIELDS:
+            self._index[field].clear()
+        self.watermark = None
+
+        self.apply(records)
+        self.ready = True
+
+    def apply(self, records: Iterable[Dict[str, Any]]) -> None:
+        """应用增量变更：active 的写入/覆盖，其余状态移除"""
+        for record in records:
+            record_id = str(record.get("id"))
+            self.remove(record_id)
+
+            if record.get("status", "active") == "active":
+                self._add(record_id, record)
+
+            marker = _change_marker(record)
+            if marker and (self.watermark is None or marker > self.watermark):
+                self.watermark = marker
+
+    def remove(self, record_id: str) -> None:
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return
+
+        for field in INDEXED_FIELDS:
+            postings = self._index[field]
+            for value in _field_values(record, field):
+                for term in tokenize(value):
+                    ids = postings.get(term)
+                    if ids is not None:
+                        ids.discard(record_id)
+                        if not ids:
+                            del postings[term]
+
+    def search(self, keywords: str, category: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        """
+        按检索词命中的字段加权打分，同分按评分排序
+
+        无检索词时返回评分最高的供应商
+        """
+        terms = tokenize(f"{keywords or ''} {category or ''}")
+
+        if not terms:
+            candidates = {record_id: 0.0 for record_id in self._records}
+        else:
+            candidates = defaultdict(float)
+            for field, weight in INDEXED_FIELDS.items():
+                postings = self._index[field]
+                for term in terms:
+                    for record_id in postings.get(term, ()):
+                        candidates[record_id] += weight
+
+        ranked = sorted(
+            candidates.items(),
+            key=lambda item: (
+                item[1],
+                self._records[item[0]].get("rating") or 0,
+                self._records[item[0]].get("quality_score") or 0
+            ),
+            reverse=True
+        )
+        return [self._records[record_id] for record_id, _ in ranked[:limit]]
+
+    def _add(self, record_id: str, record: Dict[str, Any]) -> None:
+        self._records[record_id] = record
+        for field in INDEXED_FIELDS:
+            for value in _field_values(record, field):
+                for term in tokenize(value):
+                    self._index[field][term].add(record_id)
@@ -4,33 +4,123 @@ TikTok Hunter - 视频抓取与 AI 视觉分析模块
 """
 
 import os
-import re
+import sys
+import time
 import asyncio
 import tempfile
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable, Sequence, Tuple
 from pathlib import Path
 
-import cv2
-import numpy as np
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
+import config  # noqa: F401  须先于读取环境变量的模块导入
+from analysis_cache import get_analysis_cache, resolve_video_id
+from json_stream import IncrementalJsonObject
+from analysis_schema import (
+    ANALYSIS_SCHEMA,
+    BATCH_ANALYSIS_SCHEMA,
+    coerce_fields,
+    fill_defaults,
+    response_format,
+    subschema,
+    validate_analysis
+)
+from vision_provider import BATCH_ITEM_LABEL, get_vision_provider
+from metrics import Counter, Histogram
 
-load_dotenv()
+if TYPE_CHECKING:
+    import numpy as np
 
-# OpenAI Client
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenCV / NumPy（frames、vision_budget）与 OpenAI SDK 在首次分析时才加载；
+# Bot 连上网关后在后台线程预加载，首个请求无需等待
+ANALYSIS_PRELOAD = os.getenv("ANALYSIS_PRELOAD", "true").lower() == "true"
+
+# Structured Outputs（json_schema 严格模式）与字段定向修复
+ANALYSIS_STRUCTURED_OUTPUT = os.getenv("ANALYSIS_STRUCTURED_OUTPUT", "true").lower() == "true"
+ANALYSIS_REPAIR_MODEL = os.getenv("ANALYSIS_REPAIR_MODEL", "gpt-4o-mini")
+
+# 模型级联：按顺序尝试，置信度 / schema 完整度（合法字段占比）不达标时升级
+ANALYSIS_CASCADE = os.getenv("ANALYSIS_CASCADE", "true").lower() == "true"
+_DEFAULT_CASCADE_MODELS = "gpt-4o-mini,gpt-4o"
+ANALYSIS_CASCADE_MODELS = [
+    model.strip() for model in os.getenv("ANALYSIS_CASCADE_MODELS", _DEFAULT_CASCADE_MODELS).split(",") if model.strip()
+]
+if not ANALYSIS_CASCADE_MODELS:
+    # 配置为空字符串 / 只有空白时级联没有可用模型，回退到默认值
+    print(f"⚠️ ANALYSIS_CASCADE_MODELS 为空，使用默认值 {_DEFAULT_CASCADE_MODELS}")
+    ANALYSIS_CASCADE_MODELS = _DEFAULT_CASCADE_MODELS.split(",")
+ANALYSIS_CASCADE_MIN_CONFIDENCE = float(os.getenv("ANALYSIS_CASCADE_MIN_CONFIDENCE", "0.75"))
+ANALYSIS_CASCADE_MIN_COMPLETENESS = float(os.getenv("ANALYSIS_CASCADE_MIN_COMPLETENESS", "1.0"))
+
+ANALYSIS_TIER_RESULTS = Counter(
+    "analysis_tier_results_total", "级联各级模型的结果（accepted / escalated / error）", ("model", "outcome")
+)
+ANALYSIS_TIER_LATENCY = Histogram(
+    "analysis_tier_duration_seconds", "级联各级模型的分析耗时（含本地校验）", ("model",)
+)
+
+# 流式分析时每个顶层字段解析完成即回调 (字段名, 值)
+FieldCallback = Callable[[str, Any], None]
+
+# 后台批量分析：每个请求合并的视频数 / 使用的模型
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "4"))
+ANALYSIS_BATCH_MODEL = os.getenv("ANALYSIS_BATCH_MODEL", "gpt-4o")
+
+ANALYSIS_SYSTEM_PROMPT = """你是一位资深的跨境电商产品分析专家，专门从视频内容中识别可采购的产品。
+
+你的任务是：
+1. 识别视频中展示的主要产品
+2. 分析产品的材质、功能、尺寸等特征
+3. 评估产品的市场潜力和采购难度
+4. 提供专业的采购建议
+
+请用中文回复，并按照以下 JSON 格式输出：
+{
+    "product_name": "产品名称（中英文）",
+    "category": "产品类目",
+    "features": ["功能特点1", "功能特点2", ...],
+    "materials": ["主要材质1", "材质2", ...],
+    "estimated_dimensions": "大致尺寸",
+    "target_audience": "目标用户群",
+    "selling_points": ["卖点1", "卖点2", ...],
+    "estimated_price_range": "估计FOB价格区间",
+    "sourcing_difficulty": "low/medium/high",
+    "sourcing_advice": "采购建议",
+    "confidence": 0.85
+}"""
+
+ANALYSIS_USER_PROMPT = """请分析这个TikTok视频中展示的产品。
+        
+以下图片是按时间顺序提取的视频关键帧（可能拼接为一张联系表），请基于画面内容和你的专业知识进行详细分析。
+
+请特别关注：
+- 产品的核心功能和使用场景
+- 材质和做工质量预估
+- 在跨境电商平台上的竞争力
+- 适合的工厂类型（注塑、五金、电子等）"""
+
+BATCH_USER_PROMPT = """请分别分析以下 {count} 个 TikTok 视频中展示的产品。
+
+每个视频的关键帧前都有【视频 i】标注，不同视频之间互不相关。
+请输出 {{"items": [...]}}，每个视频一项，video_index 为标注中的序号，其余字段与单个视频的分析格式相同。"""
 
 
 class TikTokHunter:
     """TikTok 产品识别引擎"""
     
-    def __init__(self):
+    def __init__(self, num_frames: int = 3, priority: str = "interactive", provider=None):
         self.temp_dir = tempfile.gettempdir()
+        # 送入视觉模型的帧数上限
+        self.num_frames = num_frames
+        # OpenAI 限流器中的优先级：interactive（Discord 用户）/ background
+        self.priority = priority
+        # 模型调用后端（OpenAIProvider / 测试用 LocalVisionProvider）
+        self.provider = provider or get_vision_provider()
     
-    async def analyze_video_url(self, url: str) -> Dict[str, Any]:
+    async def analyze_video_url(self, url: str, on_field: Optional[FieldCallback] = None) -> Dict[str, Any]:
         """
         完整的视频分析流程
         
+        传入 on_field 时以流式模式调用模型，每个字段解析完成即回调
+        
         Returns:
             {
                 "success": bool,
@@ -41,125 +131,349 @@ class TikTokHunter:
                 "estimated_price_range": str,
                 "sourcing_difficulty": str,
                 "confidence": float,
-                "raw_analysis": str
+                "raw_analysis": str,
+                "frame_dedup": {"candidates": int, "unique": int, "kept": int, "dedup_ratio": float},
+                "vision_budget": {"detail": str, "contact_sheet": bool, "images": int, "image_tokens": int, "bytes": int}
             }
         """
         try:
-            # 1. 提取关键帧
-            frames = await self._extract_key_frames(url)
-            
-            if not frames:
-                return {"success": False, "error": "无法提取视频帧"}
+            prepared = await self._prepare_video(url)
+            if not prepared["success"]:
+                return prepared
             
-            # 2. GPT-4o 视觉分析
-            analysis = await self._analyze_frames_with_gpt4o(frames)
+            # 4. GPT-4o 视觉分析
+            analysis = await self._analyze_frames_with_gpt4o(prepared["images"], on_field)
             
             return {
                 "success": True,
-                **analysis
+                **analysis,
+                "frame_dedup": prepared["frame_dedup"],
+                "vision_budget": prepared["vision_budget"]
             }
             
         except Exception as e:
             print(f"❌ 分析失败: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    async def _extract_key_frames(self, url: str, num_frames: int = 3) -> List[str]:
-        """
-        从视频中提取关键帧
+    async def _prepare_video(self, url: str) -> Dict[str, Any]:
+        """下载并准备视觉输入：{"success", "images", "frame_dedup", "vision_budget"} 或 {"success": False, "error"}"""
+        from frames import FRAME_CANDIDATES, dedup_frames
+        from vision_budget import prepare_images
         
-        实际实现中使用 yt-dlp 下载 + OpenCV 提取
-        这里提供模拟实现
-        """
-        # TODO: 实际实现
-        # 1. 使用 yt-dlp 下载视频
-        # 2. 使用 OpenCV 提取关键帧
-        # 3. 保存为临时文件并返回路径列表
+        # 1. 提取候选关键帧
+        candidates = await self._extract_key_frames(url, num_frames=FRAME_CANDIDATES)
         
-        # 模拟实现 - 返回占位图片路径
-        print(f"📹 正在下载视频: {url}")
-        await asyncio.sleep(1)  # 模拟下载时间
+        if not candidates:
+            return {"success": False, "error": "无法提取视频帧"}
         
-        # 在实际实现中，这里会返回真实的帧图片路径
-        return ["frame_placeholder"]
+        # 2. pHash 去重，保留差异最大的几帧
+        frames, dedup = dedup_frames(candidates, self.num_frames)
+        print(f"🧹 帧去重: {dedup['candidates']} -> {dedup['kept']} 帧 (重复率 {dedup['dedup_ratio']:.0%})")
+        
+        # 3. 视觉输入准备：按 detail 档位缩放、内存 JPEG 编码、可选拼联系表
+        images, vision_budget = prepare_images(frames)
+        print(
+            f"🖼️ 视觉输入: {vision_budget['images']} 张 ({vision_budget['detail']}), "
+            f"约 {vision_budget['image_tokens']} 图像 token, {vision_budget['bytes'] // 1024} KB"
+        )
+        
+        return {"success": True, "images": images, "frame_dedup": dedup, "vision_budget": vision_budget}
     
-    async def _analyze_frames_with_gpt4o(self, frame_paths: List[str]) -> Dict[str, Any]:
+    async def analyze_batch(
+        self,
+        urls: List[str],
+        batch_size: int = ANALYSIS_BATCH_SIZE,
+        use_batch_api: bool = False
+    ) -> List[Dict[str, Any]]:
         """
-        使用 GPT-4o Vision 分析视频帧
+        多视频合并分析（后台趋势扫描用）
         
-        Prompt Engineering 是关键！
+        每 batch_size 个视频合并为一次请求：共享系统提示词与说明，每个视频的图片前加【视频 i】标注，
+        按 video_index 拆回各自结果；use_batch_api=True 时通过异步 Batch API 提交。
+        合并结果中缺失的视频退回单视频分析。返回结果与 urls 一一对应
         """
+        import json
+        from frames import FRAME_WORKERS
         
-        # 构建分析 Prompt
-        system_prompt = """你是一位资深的跨境电商产品分析专家，专门从视频内容中识别可采购的产品。
-
-你的任务是：
-1. 识别视频中展示的主要产品
-2. 分析产品的材质、功能、尺寸等特征
-3. 评估产品的市场潜力和采购难度
-4. 提供专业的采购建议
-
-请用中文回复，并按照以下 JSON 格式输出：
-{
-    "product_name": "产品名称（中英文）",
-    "category": "产品类目",
-    "features": ["功能特点1", "功能特点2", ...],
-    "materials": ["主要材质1", "材质2", ...],
-    "estimated_dimensions": "大致尺寸",
-    "target_audience": "目标用户群",
-    "selling_points": ["卖点1", "卖点2", ...],
-    "estimated_price_range": "估计FOB价格区间",
-    "sourcing_difficulty": "low/medium/high",
-    "sourcing_advice": "采购建议",
-    "confidence": 0.85
-}"""
-
-        user_prompt = """请分析这个TikTok视频中展示的产品。
+        # 同时下载 / 解码的视频数不超过关键帧工作进程数，避免整批视频同时排进进程池
+        slots = asyncio.Semaphore(FRAME_WORKERS)
         
-视频链接已处理，关键帧已提取。请基于你的专业知识，假设这是一个典型的 TikTok 热门产品视频（如家居小工具、创意电子产品等），进行详细分析。
-
-请特别关注：
-- 产品的核心功能和使用场景
-- 材质和做工质量预估
-- 在跨境电商平台上的竞争力
-- 适合的工厂类型（注塑、五金、电子等）"""
-
-        try:
-            # 调用 GPT-4o
-            # 实际实现中，这里会将图片作为 base64 传入
-            response = await openai_client.chat.completions.create(
-                model="gpt-4o",
+        async def prepare(url: str) -> Dict[str, Any]:
+            async with slots:
+                return await self._prepare_video(url)
+        
+        prepared = await asyncio.gather(*(prepare(url) for url in urls), return_exceptions=True)
+        results: List[Dict[str, Any]] = [
+            item if isinstance(item, dict) else {"success": False, "error": str(item)} for item in prepared
+        ]
+        ready = [index for index, item in enumerate(results) if item["success"]]
+        groups = [ready[start:start + max(1, batch_size)] for start in range(0, len(ready), max(1, batch_size))]
+        
+        requests = []
+        for number, group in enumerate(groups):
+            content: List[Dict[str, Any]] = [{"type": "text", "text": BATCH_USER_PROMPT.format(count=len(group))}]
+            for position, index in enumerate(group, 1):
+                content.append({"type": "text", "text": BATCH_ITEM_LABEL.format(index=position)})
+                content.extend(results[index]["images"])
+            requests.append((f"group-{number}", dict(
+                model=ANALYSIS_BATCH_MODEL,
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
+                    {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                    {"role": "user", "content": content}
                 ],
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=900 * len(group),
+                response_format=response_format(BATCH_ANALYSIS_SCHEMA, "product_analysis_batch")
+            )))
+        
+        if use_batch_api:
+            try:
+                outputs = await self.provider.run_batch(requests)
+            except Exception as e:
+                # 上传 / 轮询失败或 Batch 过期：视为全部缺失，逐个走单视频分析
+                print(f"⚠️ Batch API 提交失败，改为单独分析: {str(e)}")
+                outputs = {}
+            contents = [outputs.get(custom_id, "") for custom_id, _ in requests]
+        else:
+            contents = await asyncio.gather(
+                *(self.provider.complete(self.priority, **body) for _, body in requests), return_exceptions=True
             )
-            
-            content = response.choices[0].message.content
-            
-            # 解析 JSON 响应
-            import json
-            
-            # 尝试提取 JSON
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                analysis = json.loads(json_match.group())
-                analysis["raw_analysis"] = content
-                return analysis
+        
+        for group, content in zip(groups, contents):
+            items: Dict[int, Dict[str, Any]] = {}
+            if isinstance(content, str):
+                try:
+                    for item in json.loads(content or "{}").get("items", []):
+                        if isinstance(item, dict) and isinstance(item.get("video_index"), int):
+                            items[item.pop("video_index")] = item
+                except (json.JSONDecodeError, AttributeError):
+                    pass
             else:
-                # 返回原始文本
-                return {
-                    "product_name": "未能识别",
-                    "raw_analysis": content,
-                    "confidence": 0.3
+                print(f"⚠️ 合并分析请求失败: {str(content)}")
+            
+            for position, index in enumerate(group, 1):
+                video = results[index]
+                if position in items:
+                    analysis = await self._finalize_analysis(json.dumps(items[position], ensure_ascii=False))
+                    analysis["model_cascade"] = {"model": ANALYSIS_BATCH_MODEL, "batch_size": len(group)}
+                else:
+                    print(f"⚠️ 合并结果缺少视频 {position}，改为单独分析: {urls[index]}")
+                    analysis = await self._analyze_frames_with_gpt4o(video["images"])
+                results[index] = {
+                    "success": True,
+                    **analysis,
+                    "frame_dedup": video["frame_dedup"],
+                    "vision_budget": video["vision_budget"]
                 }
+        
+        return results
+    
+    async def _extract_key_frames(self, url: str, num_frames: int = 3) -> List["np.ndarray"]:
+        """
+        从视频中提取关键帧
+        
+        yt-dlp 边下载边交给 OpenCV 解码，在进程池中按场景切换挑选关键帧，
+        返回 BGR 图像数组列表；失败或超出时间预算时返回空列表
+        """
+        from frames import extract_key_frames_async
+        
+        print(f"📹 正在下载视频: {url}")
+        try:
+            return await extract_key_frames_async(url, num_frames)
+        except Exception as e:
+            print(f"❌ 关键帧提取失败: {str(e)}")
+            return []
+    
+    async def _analyze_frames_with_gpt4o(
+        self,
+        images: List[Dict[str, Any]],
+        on_field: Optional[FieldCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        使用 GPT-4o Vision 分析视频帧
+        
+        images 为 prepare_images 生成的 image_url 内容块；
+        传入 on_field 时流式接收输出，边接收边增量解析 JSON
+        
+        Prompt Engineering 是关键！
+        """
+        
+        try:
+            # 调用视觉模型（关键帧以 base64 JPEG 内联传入）
+            messages = [
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                {"role": "user", "content": [{"type": "text", "text": ANALYSIS_USER_PROMPT}, *images]}
+            ]
+            
+            models = ANALYSIS_CASCADE_MODELS if ANALYSIS_CASCADE else ANALYSIS_CASCADE_MODELS[-1:]
+            return await self._cascade(messages, models, on_field)
                 
         except Exception as e:
             print(f"❌ GPT-4o 分析失败: {str(e)}")
             # 返回模拟数据用于演示
             return self._get_demo_analysis()
     
+    async def _cascade(
+        self,
+        messages: List[Dict[str, Any]],
+        models: List[str],
+        on_field: Optional[FieldCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        模型级联：从便宜的模型开始，置信度或 schema 完整度不达标时升级到下一级
+        
+        非最后一级只做本地纠正、不调用修复模型；最后一级的结果无条件采用
+        """
+        tiers: List[Dict[str, Any]] = []
+        for index, model in enumerate(models):
+            last = index == len(models) - 1
+            started = time.perf_counter()
+            try:
+                content, parser = await self._complete(model, messages, on_field)
+                analysis = await self._finalize_analysis(content, parser, repair=last)
+            except Exception as e:
+                if last:
+                    raise
+                print(f"⚠️ {model} 分析失败，升级到 {models[index + 1]}: {str(e)}")
+                ANALYSIS_TIER_RESULTS.inc(model, "error")
+                tiers.append({"model": model, "error": str(e)})
+                continue
+            elapsed = time.perf_counter() - started
+            
+            unresolved = analysis["schema_repair"]["unresolved"]
+            completeness = 1 - len(unresolved) / len(ANALYSIS_SCHEMA["properties"])
+            confidence = analysis.get("confidence")
+            if "confidence" in unresolved or not isinstance(confidence, (int, float)):
+                confidence = 0.0
+            accepted = last or (
+                confidence >= ANALYSIS_CASCADE_MIN_CONFIDENCE
+                and completeness >= ANALYSIS_CASCADE_MIN_COMPLETENESS
+            )
+            
+            ANALYSIS_TIER_LATENCY.observe(model, value=elapsed)
+            ANALYSIS_TIER_RESULTS.inc(model, "accepted" if accepted else "escalated")
+            tiers.append({
+                "model": model,
+                "confidence": confidence,
+                "completeness": round(completeness, 3),
+                "latency_s": round(elapsed, 3)
+            })
+            
+            if accepted:
+                if unresolved:
+                    # 低级模型的结果达标但仍有缺失字段：只修复这些字段
+                    analysis = await self._finalize_analysis(content, parser)
+                analysis["model_cascade"] = {"model": model, "tiers": tiers}
+                return analysis
+            
+            print(
+                f"⤴️ {model} 置信度 {confidence:.2f} / 完整度 {completeness:.0%} 未达标，"
+                f"升级到 {models[index + 1]}"
+            )
+    
+    async def _complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        on_field: Optional[FieldCallback] = None
+    ) -> Tuple[str, Optional[IncrementalJsonObject]]:
+        """
+        调用一次模型，返回 (原始文本, 增量解析器)
+        
+        传入 on_field 时流式接收，字段到齐即回调；否则返回解析器为 None
+        """
+        options = dict(model=model, messages=messages, temperature=0.7, max_tokens=1000, **self._output_options())
+        
+        if on_field is not None:
+            parser = IncrementalJsonObject(on_field)
+            await self.provider.stream(parser.feed, self.priority, **options)
+            return parser.text, parser
+        
+        return await self.provider.complete(self.priority, **options), None
+    
+    def _output_options(self) -> Dict[str, Any]:
+        return {"response_format": response_format()} if ANALYSIS_STRUCTURED_OUTPUT else {}
+    
+    async def _finalize_analysis(
+        self,
+        content: str,
+        parser: Optional[IncrementalJsonObject] = None,
+        repair: bool = True
+    ) -> Dict[str, Any]:
+        """
+        按预编译 schema 校验模型输出
+        
+        不合法 / 缺失的字段依次：本地类型纠正 -> 小模型只补这些字段 -> 占位值；
+        截断的输出也保留已完整的字段，不整次重新分析。
+        repair=False 时只做本地纠正，剩余问题字段记入 schema_repair.unresolved
+        """
+        if parser is None:
+            parser = IncrementalJsonObject()
+            parser.feed(content)
+        parsed = parser.result() or dict(parser.fields)
+        analysis = {key: value for key, value in parsed.items() if key in ANALYSIS_SCHEMA["properties"]}
+        
+        errors = validate_analysis(analysis)
+        invalid = list(errors)
+        repaired_by_model: List[str] = []
+        
+        if errors:
+            analysis = coerce_fields(analysis, errors)
+            errors = validate_analysis(analysis)
+        
+        if errors and not repair:
+            analysis["raw_analysis"] = content
+            analysis["schema_repair"] = {"invalid": invalid, "repaired_by_model": [], "unresolved": list(errors)}
+            return analysis
+        
+        if errors:
+            patch = await self._repair_fields(list(errors), analysis, content)
+            for key in errors:
+                if key in patch:
+                    analysis[key] = patch[key]
+            remaining = validate_analysis(analysis)
+            repaired_by_model = [key for key in errors if key not in remaining]
+            errors = remaining
+        
+        if errors:
+            print(f"⚠️ 分析结果字段无法修复: {errors}")
+            analysis = fill_defaults(analysis, errors)
+        elif invalid:
+            print(f"🩹 已修复分析字段: {', '.join(invalid)}")
+        
+        analysis["raw_analysis"] = content
+        analysis["schema_repair"] = {
+            "invalid": invalid,
+            "repaired_by_model": repaired_by_model,
+            "unresolved": list(errors)
+        }
+        return analysis
+    
+    async def _repair_fields(self, fields: List[str], analysis: Dict[str, Any], content: str) -> Dict[str, Any]:
+        """定向修复：不带图片，只让小模型按子 schema 输出出错的字段"""
+        import json
+        
+        valid = {key: value for key, value in analysis.items() if key not in fields}
+        prompt = (
+            f"下面是一次产品分析的模型输出，其中字段 {', '.join(fields)} 缺失或格式不正确。\n"
+            f"已确认的字段：{json.dumps(valid, ensure_ascii=False)}\n"
+            f"原始输出：{content[:4000]}\n\n"
+            f"请根据以上信息，只输出这些字段的 JSON（中文）。"
+        )
+        try:
+            content = await self.provider.complete(
+                self.priority,
+                model=ANALYSIS_REPAIR_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=400,
+                response_format=response_format(subschema(fields), "product_analysis_repair")
+            )
+            return json.loads(content or "{}")
+        except Exception as e:
+            print(f"⚠️ 字段修复失败: {str(e)}")
+            return {}
+    
     def _get_demo_analysis(self) -> Dict[str, Any]:
         """返回演示用的模拟分析结果"""
         return {
@@ -188,7 +502,9 @@ class TikTokHunter:
             "sourcing_difficulty": "low",
             "sourcing_advice": "建议选择宁波或中山的小家电工厂，MOQ 通常在 500-1000 件。",
             "confidence": 0.92,
-            "raw_analysis": "Demo mode - 实际部署时将使用 GPT-4o Vision 进行真实分析"
+            "raw_analysis": "Demo mode - 实际部署时将使用 GPT-4o Vision 进行真实分析",
+            # 模型调用失败时的兜底数据，不写入分析缓存
+            "demo": True
         }
 
 
@@ -204,6 +520,15 @@ class PriceCalculator:
         "default": {"material": 1.0, "labor": 0.8, "overhead": 0.3}
     }
     
+    # 基础价格（美元，按复杂度）
+    BASE_PRICES = {"low": 2.0, "medium": 4.0, "high": 8.0}
+    DEFAULT_BASE_PRICE = 4.0
+    
+    # 批量折扣：(起订量下限, 折扣系数)，按下限升序
+    DISCOUNT_TIERS = [(1000, 0.96), (2000, 0.92), (5000, 0.85)]
+    
+    COST_COMPONENTS = ("material", "labor", "overhead")
+    
     @classmethod
     def estimate_fob_price(
         cls, 
@@ -222,8 +547,7 @@ class PriceCalculator:
         coef = cls.CATEGORY_COEFFICIENTS.get(category, cls.CATEGORY_COEFFICIENTS["default"])
         
         # 基础价格（美元）
-        base_prices = {"low": 2.0, "medium": 4.0, "high": 8.0}
-        base = base_prices.get(complexity, 4.0)
+        base = cls.BASE_PRICES.get(complexity, cls.DEFAULT_BASE_PRICE)
         
         # 计算各项成本
         material_cost = base * coef["material"]
@@ -231,14 +555,10 @@ class PriceCalculator:
         overhead_cost = base * coef["overhead"]
         
         # 批量折扣
-        if quantity >= 5000:
-            discount = 0.85
-        elif quantity >= 2000:
-            discount = 0.92
-        elif quantity >= 1000:
-            discount = 0.96
-        else:
-            discount = 1.0
+        discount = 1.0
+        for threshold, factor in cls.DISCOUNT_TIERS:
+            if quantity >= threshold:
+                discount = factor
         
         total = (material_cost + labor_cost + overhead_cost) * discount
         
@@ -253,15 +573,208 @@ class PriceCalculator:
             "discount_applied": f"{int((1-discount)*100)}%",
             "lead_time_days": 15 if quantity < 1000 else 25
         }
+    
+    @classmethod
+    def estimate_fob_prices(
+        cls,
+        categories: Sequence[str],
+        complexities: Sequence[str],
+        quantities: Sequence[int]
+    ) -> Dict[str, "np.ndarray"]:
+        """
+        批量估算 FOB 价格（批量询盘导入、看板的 SKU × 起订量矩阵）
+        
+        三个输入按 NumPy 规则广播（可传标量或等长数组）；品类 / 复杂度先编码为整数，
+        只对不同取值查一次系数表，其余计算一次完成。结果与逐个调用 estimate_fob_price 一致
+        
+        Returns:
+            {"unit_price_usd", "material", "labor", "overhead", "quantity",
+             "discount_rate", "lead_time_days"}，各为与广播后输入同形状的数组
+        """
+        import numpy as np
+        
+        category_codes, names = _factorize(categories)
+        level_codes, levels = _factorize(complexities)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        
+        default = cls.CATEGORY_COEFFICIENTS["default"]
+        coef_table = np.array([
+            [cls.CATEGORY_COEFFICIENTS.get(name, default)[part] for part in cls.COST_COMPONENTS]
+            for name in names
+        ]).reshape(-1, len(cls.COST_COMPONENTS))
+        base_table = np.array([cls.BASE_PRICES.get(level, cls.DEFAULT_BASE_PRICE) for level in levels])
+        
+        costs = base_table[level_codes][..., None] * coef_table[category_codes]
+        
+        # 起订量落在第几档（0 = 无折扣）
+        thresholds = np.array([threshold for threshold, _ in cls.DISCOUNT_TIERS])
+        factors = np.array([1.0] + [factor for _, factor in cls.DISCOUNT_TIERS])
+        discount = factors[np.searchsorted(thresholds, quantities, side="right")]
+        
+        total = (costs[..., 0] + costs[..., 1] + costs[..., 2]) * discount
+        shape = total.shape
+        
+        return {
+            "unit_price_usd": np.round(total, 2),
+            **{
+                part: np.round(np.broadcast_to(costs[..., index], shape), 2)
+                for index, part in enumerate(cls.COST_COMPONENTS)
+            },
+            "quantity": np.broadcast_to(quantities, shape).copy(),
+            "discount_rate": np.broadcast_to(1 - discount, shape).copy(),
+            "lead_time_days": np.broadcast_to(np.where(quantities < 1000, 15, 25), shape).copy()
+        }
+
+
+def _factorize(values: Sequence[str]) -> Tuple["np.ndarray", List[str]]:
+    """
+    字符串数组编码为 (整数编码数组, 按首次出现排列的不同取值)
+    
+    逐个查 dict 编码，比对 object 数组做 np.unique 排序快数倍
+    """
+    import numpy as np
+    
+    array = np.asarray(values, dtype=object)
+    codes: Dict[str, int] = {}
+    flat = np.fromiter(
+        (codes.setdefault(value, len(codes)) for value in array.ravel()), dtype=np.intp, count=array.size
+    )
+    return flat.reshape(array.shape), list(codes)
+
+
+# 同一视频 ID 的并发分析共享同一个任务
+_inflight_analyses: Dict[str, asyncio.Task] = {}
+
+
+def _is_cacheable(result: Dict[str, Any]) -> bool:
+    """只缓存真实的模型输出；演示兜底数据（demo）缓存后会在 TTL 内顶替真实分析"""
+    return bool(result.get("success")) and not result.get("demo")
+
+
+async def _analyze_and_cache(
+    video_id: str,
+    canonical_url: str,
+    on_field: Optional[FieldCallback] = None,
+    priority: str = "interactive"
+) -> Dict[str, Any]:
+    hunter = TikTokHunter(priority=priority)
+    result = await hunter.analyze_video_url(canonical_url, on_field)
+    result = {**result, "video_id": video_id, "canonical_url": canonical_url}
+    if _is_cacheable(result):
+        await get_analysis_cache().put(video_id, result)
+    return {**result, "cache": "miss"}
 
 
 # 导出便捷函数
-async def analyze_tiktok_video(url: str) -> Dict[str, Any]:
-    """分析 TikTok 视频的便捷入口"""
-    hunter = TikTokHunter()
-    return await hunter.analyze_video_url(url)
+async def analyze_tiktok_video(
+    url: str,
+    on_field: Optional[FieldCallback] = None,
+    priority: str = "interactive"
+) -> Dict[str, Any]:
+    """
+    分析 TikTok 视频的便捷入口
+    
+    短链先解析为规范视频 ID；命中分析缓存时直接返回，跳过下载与模型调用。
+    结果中 cache 字段标明来源：memory / shared / miss
+    
+    on_field 仅在实际调用模型时触发（缓存命中或合并到进行中的分析时不回调）；
+    priority 为 OpenAI 限流器中的优先级，后台任务传 "background"
+    """
+    video_id, canonical_url = await resolve_video_id(url)
+    if video_id is None:
+        hunter = TikTokHunter(priority=priority)
+        return await hunter.analyze_video_url(url, on_field)
+    
+    cached, tier = await get_analysis_cache().get(video_id)
+    if cached is not None:
+        print(f"⚡ 分析缓存命中 ({tier}): {video_id}")
+        return {**cached, "video_id": video_id, "canonical_url": canonical_url, "cache": tier}
+    
+    task = _inflight_analyses.get(video_id)
+    if task is None:
+        task = asyncio.create_task(_analyze_and_cache(video_id, canonical_url, on_field, priority))
+        _inflight_analyses[video_id] = task
+        task.add_done_callback(lambda _: _inflight_analyses.pop(video_id, None))
+    # shield：某个调用方被取消时不影响其他等待同一视频的调用方
+    return await asyncio.shield(task)
+
+
+async def analyze_tiktok_videos(
+    urls: List[str],
+    batch_size: int = ANALYSIS_BATCH_SIZE,
+    use_batch_api: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    批量分析多个 TikTok 视频（后台优先级）
+    
+    先查分析缓存，只把未命中的视频交给 TikTokHunter.analyze_batch 合并分析，
+    成功结果写回缓存。返回结果与 urls 一一对应
+    """
+    resolved = await asyncio.gather(*(resolve_video_id(url) for url in urls))
+    results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+    pending: List[int] = []
+    for index, (video_id, canonical_url) in enumerate(resolved):
+        if video_id is not None:
+            cached, tier = await get_analysis_cache().get(video_id)
+            if cached is not None:
+                results[index] = {**cached, "video_id": video_id, "canonical_url": canonical_url, "cache": tier}
+                continue
+        pending.append(index)
+    
+    if pending:
+        hunter = TikTokHunter(priority="background")
+        analyses = await hunter.analyze_batch(
+            [resolved[index][1] or urls[index] for index in pending], batch_size, use_batch_api
+        )
+        for index, result in zip(pending, analyses):
+            video_id, canonical_url = resolved[index]
+            if video_id is not None:
+                result = {**result, "video_id": video_id, "canonical_url": canonical_url}
+                if _is_cacheable(result):
+                    await get_analysis_cache().put(video_id, result)
+            results[index] = {**result, "cache": "miss"}
+    
+    return results
+
+
+_preload_task: Optional[asyncio.Task] = None
+
+
+def _load_analysis_stack() -> None:
+    started = time.perf_counter()
+    try:
+        import frames, vision_budget  # noqa: F401
+        get_vision_provider()
+        print(f"📦 分析依赖已预加载 ({time.perf_counter() - started:.2f}s)")
+    except Exception as e:
+        print(f"⚠️ 分析依赖预加载失败: {str(e)}")
+
+
+def preload_analysis() -> None:
+    """在后台线程导入 OpenCV / NumPy / OpenAI SDK 并创建客户端（幂等，需在事件循环中调用）"""
+    global _preload_task
+    
+    if not ANALYSIS_PRELOAD or _preload_task is not None:
+        return
+    _preload_task = asyncio.get_running_loop().create_task(asyncio.to_thread(_load_analysis_stack))
+
+
+def shutdown_analysis_workers() -> None:
+    """释放关键帧进程池；frames 从未加载时无需处理"""
+    frames = sys.modules.get("frames")
+    if frames is not None:
+        frames.shutdown_frame_workers()
 
 
 def calculate_price(category: str, complexity: str = "medium", quantity: int = 1000) -> Dict[str, Any]:
     """计算价格的便捷入口"""
     return PriceCalculator.estimate_fob_price(category, complexity, quantity)
+
+
+def calculate_prices(
+    categories: Sequence[str],
+    complexities: Sequence[str] = "medium",
+    quantities: Sequence[int] = 1000
+) -> Dict[str, "np.ndarray"]:
+    """批量计算价格的便捷入口"""
+    return PriceCalculator.estimate_fob_prices(categories, complexities, quantities)
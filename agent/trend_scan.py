@@ -0,0 +1,88 @@
+"""
+Trend Scan - 后台批量视频分析与吞吐量对比
+按不同的合并批大小分析同一组视频，统计成功视频/秒、模型请求数与估算 token
+
+用法:
+    # 离线：合成关键帧 + 本地视觉模型替身（单次请求 800ms + 每张图 40ms，并发 4）
+    python trend_scan.py --synthetic 32 --local --batch-size 1,4,8
+
+    # 真实视频与 OpenAI（URL 每行一个）；--batch-api 走异步 Batch API
+    python trend_scan.py --urls trending.txt --batch-size 4
+"""
+
+import time
+import asyncio
+import argparse
+from typing import List
+
+import numpy as np
+
+
+def synthetic_hunter_class():
+    from tiktok_hunter import TikTokHunter
+
+    class SyntheticHunter(TikTokHunter):
+        """不下载视频：每个"视频"生成若干张互不相同的随机帧"""
+
+        async def _extract_key_frames(self, url: str, num_frames: int = 3) -> List[np.ndarray]:
+            rng = np.random.default_rng(abs(hash(url)) % (2 ** 32))
+            return [rng.integers(0, 256, (720, 405, 3), dtype=np.uint8) for _ in range(num_frames)]
+
+    return SyntheticHunter
+
+
+async def run(args: argparse.Namespace) -> None:
+    from tiktok_hunter import TikTokHunter
+    from vision_provider import LocalVisionProvider, get_vision_provider
+
+    if args.synthetic:
+        urls = [f"https://www.tiktok.com/@synthetic/video/{7000000000000000000 + i}" for i in range(args.synthetic)]
+        hunter_class = synthetic_hunter_class()
+    else:
+        with open(args.urls, encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip()]
+        hunter_class = TikTokHunter
+
+    # videos/s 只统计分析成功的视频
+    print(f"\n{'batch':>6}{'videos':>8}{'ok':>6}{'requests':>10}{'tokens':>10}{'seconds':>10}{'ok/s':>10}")
+    for batch_size in [int(size) for size in args.batch_size.split(",")]:
+        provider = (
+            LocalVisionProvider(args.latency_ms, args.per_image_ms, args.concurrency)
+            if args.local else get_vision_provider()
+        )
+        hunter = hunter_class(priority="background", provider=provider)
+
+        started = time.perf_counter()
+        results = await hunter.analyze_batch(urls, batch_size, use_batch_api=args.batch_api)
+        elapsed = time.perf_counter() - started
+
+        ok = sum(1 for result in results if result.get("success"))
+        # 本地替身统计全部请求（含提示词与输出上限）；真实模式只统计图像 token
+        tokens = provider.tokens if args.local else sum(
+            result.get("vision_budget", {}).get("image_tokens", 0) for result in results
+        )
+        requests = provider.calls if args.local else "-"
+        print(
+            f"{batch_size:>6}{len(urls):>8}{ok:>6}{requests:>10}{tokens:>10}"
+            f"{elapsed:>10.2f}{ok / elapsed:>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量视频分析吞吐量对比")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--urls", help="视频 URL 列表文件（每行一个）")
+    source.add_argument("--synthetic", type=int, help="生成 N 个合成视频（不下载）")
+    parser.add_argument("--batch-size", default="1,4,8", help="逗号分隔的合并批大小")
+    parser.add_argument("--batch-api", action="store_true", help="通过异步 Batch API 提交")
+    parser.add_argument("--local", action="store_true", help="使用本地视觉模型替身")
+    parser.add_argument("--latency-ms", type=float, default=800, help="替身单次请求延迟")
+    parser.add_argument("--per-image-ms", type=float, default=40, help="替身每张图片附加延迟")
+    parser.add_argument("--concurrency", type=int, default=4, help="替身并发上限")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Vision Budget - 视觉模型输入准备与图像 token 估算
+关键帧按所选 detail 档位缩放，在内存中用 cv2.imencode 重新编码为 JPEG（不落地临时文件），
+可选拼成一张联系表（contact sheet），并估算每次请求的图像 token 数。
+"""
+
+import os
+import math
+import base64
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low").lower()
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+VISION_CONTACT_SHEET = os.getenv("VISION_CONTACT_SHEET", "false").lower() == "true"
+
+# OpenAI 视觉计费：low 固定 85 token；high 先缩放到 2048 内、短边 768，再按 512 切块，每块 170 + 基础 85
+_LOW_DETAIL_SIDE = 512
+_HIGH_DETAIL_MAX_SIDE = 2048
+_HIGH_DETAIL_SHORT_SIDE = 768
+_TILE_SIDE = 512
+_BASE_TOKENS = 85
+_TILE_TOKENS = 170
+
+# 联系表格子间距（像素）
+_SHEET_GUTTER = 4
+
+
+def _resize_to(frame: np.ndarray, width: int, height: int) -> np.ndarray:
+    if (width, height) == (frame.shape[1], frame.shape[0]):
+        return frame
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def target_size(width: int, height: int, detail: str) -> Tuple[int, int]:
+    """
+    按 detail 档位计算服务端实际使用的尺寸（只缩小不放大）
+
+    提前缩放到该尺寸，多出的像素只会增加上传体积和服务端处理时间
+    """
+    if detail == "low":
+        scale = min(1.0, _LOW_DETAIL_SIDE / max(width, height))
+    else:
+        scale = min(1.0, _HIGH_DETAIL_MAX_SIDE / max(width, height))
+        scale *= min(1.0, _HIGH_DETAIL_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """估算单张图片的输入 token 数（width / height 为缩放后的尺寸）"""
+    if detail == "low":
+        return _BASE_TOKENS
+    tiles = math.ceil(width / _TILE_SIDE) * math.ceil(height / _TILE_SIDE)
+    return _BASE_TOKENS + _TILE_TOKENS * tiles
+
+
+def contact_sheet(frames: List[np.ndarray]) -> np.ndarray:
+    """把关键帧按时间顺序拼成近似正方形的网格，格子尺寸取首帧尺寸"""
+    cell_height, cell_width = frames[0].shape[:2]
+    cols = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / cols)
+
+    sheet = np.full(
+        (rows * cell_height + (rows - 1) * _SHEET_GUTTER, cols * cell_width + (cols - 1) * _SHEET_GUTTER, 3),
+        255, dtype=np.uint8
+    )
+    for index, frame in enumerate(frames):
+        row, col = divmod(index, cols)
+        top = row * (cell_height + _SHEET_GUTTER)
+        left = col * (cell_width + _SHEET_GUTTER)
+        sheet[top:top + cell_height, left:left + cell_width] = _resize_to(frame, cell_width, cell_height)
+    return sheet
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = VISION_JPEG_QUALITY) -> bytes:
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG 编码失败")
+    return buffer.tobytes()
+
+
+def prepare_images(
+    frames: List[np.ndarray],
+    detail: str = VISION_DETAIL,
+    use_contact_sheet: bool = VISION_CONTACT_SHEET,
+    quality: int = VISION_JPEG_QUALITY
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    生成 chat.completions 的 image_url 内容块
+
+    Returns:
+        (内容块列表, {"detail", "contact_sheet", "images", "image_tokens", "bytes"})
+    """
+    tiled = use_contact_sheet and len(frames) > 1
+    images = [contact_sheet(frames)] if tiled else frames
+
+    parts: List[Dict[str, Any]] = []
+    tokens = 0
+    total_bytes = 0
+    for image in images:
+        width, height = target_size(image.shape[1], image.shape[0], detail)
+        data = encode_jpeg(_resize_to(image, width, height), quality)
+        tokens += estimate_image_tokens(width, height, detail)
+        total_bytes += len(data)
+        parts.append({
+            "type": "image_url",
+            "image_url": {
+                "url": "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"),
+                "detail": detail
+            }
+        })
+
+    budget = {
+        "detail": detail,
+        "contact_sheet": tiled,
+        "images": len(images),
+        "image_tokens": tokens,
+        "bytes": total_bytes
+    }
+    return parts, budget
@@ -0,0 +1,227 @@
+"""
+Vision Provider - 视觉模型调用后端
+TikTokHunter 通过 provider 调用模型，便于在测试 / 离线压测中替换为本地替身：
+
+- OpenAIProvider：经进程级限流器调用 chat.completions，支持流式与异步 Batch API
+- LocalVisionProvider：不访问网络，按请求的 response_format 生成合法 JSON，可注入延迟
+"""
+
+import os
+import re
+import json
+import asyncio
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from openai_limiter import estimate_tokens, openai_limiter
+from resilience import backoff_delay
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+# 429 / 连接错误 / 超时 / 5xx 的重试次数（SDK 自身不再重试：429 经限流器暂停后重新排队，其余按抖动退避）
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_BATCH_POLL_INTERVAL = float(os.getenv("OPENAI_BATCH_POLL_INTERVAL", "30"))
+
+# 多视频合并请求中每个视频图片前的标注
+BATCH_ITEM_LABEL = "【视频 {index}】"
+_BATCH_ITEM_PATTERN = re.compile(r"^【视频 (\d+)】")
+
+# (custom_id, chat.completions 请求参数)
+BatchRequest = Tuple[str, Dict[str, Any]]
+
+
+def _is_transient(error: Exception) -> bool:
+    """可重试的非 429 错误：连接中断、超时（APITimeoutError 是 APIConnectionError 的子类）、5xx"""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+class OpenAIProvider:
+    """OpenAI chat.completions；所有调用经 openai_limiter 排队（SDK 在创建 provider 时才导入）"""
+
+    name = "openai"
+
+    def __init__(self, client: Optional["AsyncOpenAI"] = None):
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.client = client
+
+    async def complete(self, priority: str, **options) -> str:
+        """非流式调用，返回消息文本；429 时由限流器退避后重新排队"""
+        from openai import RateLimitError
+
+        estimated = estimate_tokens(options["messages"], options.get("max_tokens", 1000))
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            try:
+                async with openai_limiter.slot(priority, estimated) as permit:
+                    raw = await self.client.chat.completions.with_raw_response.create(**options)
+                    permit.observe(raw.headers)
+                    response = await raw.parse()
+                    permit.settle(response.usage.total_tokens if response.usage else None)
+                    return response.choices[0].message.content or ""
+            except RateLimitError:
+                if attempt == OPENAI_MAX_RETRIES:
+                    raise
+            except Exception as e:
+                if attempt == OPENAI_MAX_RETRIES or not _is_transient(e):
+                    raise
+                print(f"⚠️ OpenAI 请求失败，退避后重试 ({attempt + 1}/{OPENAI_MAX_RETRIES}): {str(e)}")
+                await asyncio.sleep(backoff_delay(attempt, base=0.5, cap=8.0))
+        return ""
+
+    async def stream(self, on_delta: Callable[[str], None], priority: str, **options) -> None:
+        """
+        流式调用：整个流期间占用限流器许可
+
+        429 只会发生在建立流之前，可安全重试；连接 / 5xx 错误只在尚未输出任何内容时重试，
+        已回调过的片段无法撤回
+        """
+        from openai import RateLimitError
+
+        estimated = estimate_tokens(options["messages"], options.get("max_tokens", 1000))
+        delivered = False
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            try:
+                async with openai_limiter.slot(priority, estimated) as permit:
+                    raw = await self.client.chat.completions.with_raw_response.create(stream=True, **options)
+                    permit.observe(raw.headers)
+                    async for chunk in await raw.parse():
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            delivered = True
+                            on_delta(chunk.choices[0].delta.content)
+                    return
+            except RateLimitError:
+                if attempt == OPENAI_MAX_RETRIES:
+                    raise
+            except Exception as e:
+                if attempt == OPENAI_MAX_RETRIES or delivered or not _is_transient(e):
+                    raise
+                print(f"⚠️ OpenAI 流式请求失败，退避后重试 ({attempt + 1}/{OPENAI_MAX_RETRIES}): {str(e)}")
+                await asyncio.sleep(backoff_delay(attempt, base=0.5, cap=8.0))
+
+    async def run_batch(
+        self,
+        requests: List[BatchRequest],
+        poll_interval: float = OPENAI_BATCH_POLL_INTERVAL
+    ) -> Dict[str, str]:
+        """
+        通过异步 Batch API 提交（24h 完成窗口、价格约为同步调用一半），轮询至结束
+
+        Returns:
+            {custom_id: 消息文本}；失败的请求不在结果中
+        """
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body},
+                       ensure_ascii=False)
+            for custom_id, body in requests
+        ]
+        upload = await self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        print(f"📦 已提交 Batch {batch.id}（{len(requests)} 个请求）")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            await asyncio.sleep(poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} 未完成: {batch.status}")
+
+        output = await self.client.files.content(batch.output_file_id)
+        results: Dict[str, str] = {}
+        for line in output.text.splitlines():
+            row = json.loads(line)
+            body = (row.get("response") or {}).get("body") or {}
+            if body.get("choices"):
+                results[row["custom_id"]] = body["choices"][0]["message"].get("content") or ""
+        return results
+
+
+# ==================== 本地替身 ====================
+
+def _fake_value(schema: Dict[str, Any], seed: int) -> Any:
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fake_value(prop, seed) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        item = schema.get("items", {})
+        # 多视频合并请求：items 数量与请求中的视频数一致（由调用方通过 seed 传入）
+        if item.get("type") == "object":
+            return [_fake_value(item, index) for index in range(1, seed + 1)]
+        return [_fake_value(item, seed) for _ in range(2)]
+    if "enum" in schema:
+        return schema["enum"][seed % len(schema["enum"])]
+    if kind in ("number", "integer"):
+        return 0.9 if kind == "number" else seed
+    return f"local-{seed}"
+
+
+class LocalVisionProvider:
+    """
+    离线替身：按 response_format 的 schema 生成确定性的合法 JSON
+
+    每次调用耗时 = latency_ms + per_image_ms × 图片数，并发上限 concurrency（模拟服务端限额），
+    用于在无网络环境下衡量批处理吞吐；calls / tokens 累计请求数与估算 token
+    """
+
+    name = "local"
+
+    def __init__(self, latency_ms: float = 800, per_image_ms: float = 40, concurrency: int = 4):
+        self.latency_ms = latency_ms
+        self.per_image_ms = per_image_ms
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.calls = 0
+        self.tokens = 0
+
+    async def complete(self, priority: str, **options) -> str:
+        self.calls += 1
+        self.tokens += estimate_tokens(options["messages"], options.get("max_tokens", 1000))
+        images = 0
+        videos = 0
+        for message in options["messages"]:
+            content = message.get("content")
+            for part in content if isinstance(content, list) else []:
+                if part.get("type") == "image_url":
+                    images += 1
+                elif _BATCH_ITEM_PATTERN.match(part.get("text", "")):
+                    videos += 1
+        async with self._semaphore:
+            await asyncio.sleep((self.latency_ms + self.per_image_ms * images) / 1000)
+
+        schema = (options.get("response_format") or {}).get("json_schema", {}).get("schema", {"type": "object"})
+        return json.dumps(_fake_value(schema, videos), ensure_ascii=False)
+
+    async def stream(self, on_delta: Callable[[str], None], priority: str, **options) -> None:
+        content = await self.complete(priority, **options)
+        for start in range(0, len(content), 16):
+            on_delta(content[start:start + 16])
+
+    async def run_batch(self, requests: List[BatchRequest], poll_interval: float = 0) -> Dict[str, str]:
+        contents = await asyncio.gather(*(self.complete("background", **body) for _, body in requests))
+        return {custom_id: content for (custom_id, _), content in zip(requests, contents)}
+
+
+_default_provider: Optional[Any] = None
+
+
+def get_vision_provider():
+    """进程级默认 provider（首次使用时创建）"""
+    global _default_provider
+
+    if _default_provider is None:
+        _default_provider = OpenAIProvider()
+    return _default_provider
+
+
+def set_vision_provider(provider) -> None:
+    """替换进程级默认 provider（测试 / 离线压测）"""
+    global _default_provider
+
+    _default_provider = provider